@@ -0,0 +1,155 @@
+from datetime import date, timedelta
+from validation import is_valid_date
+from models import UserData, day_slot
+
+
+# Planned minutes are computed per day slot rather than per day: every
+# routine's minutes-per-slot table is summed into its group first, and each
+# slot is expanded once using how many days of each period fall on it. Goals
+# only visit the schedule entries inside the range.
+
+VALID_PERIODS = ["day", "week", "month", "year"]
+VALID_BREAKDOWNS = [None, "item", "type", "frequency"]
+
+
+def period_start(period, date_):
+    """
+    Parameters:
+        period (str): "day", "week", "month" or "year".
+        date_ (datetime.date): A date in the period.
+
+    Returns:
+        datetime.date: The first date of the period containing date_. Weeks
+        start on Monday.
+    """
+
+    if period == "week":
+        return date_ - timedelta(days=date_.weekday())
+    elif period == "month":
+        return date_.replace(day=1)
+    elif period == "year":
+        return date_.replace(month=1, day=1)
+    return date_
+
+
+def group_key(item, by):
+    """
+    Parameters:
+        item (Item): The item to group.
+        by (str): The breakdown, one of VALID_BREAKDOWNS.
+
+    Returns:
+        any: The key the item's minutes are added under. Goals have no
+        frequency and are grouped under None.
+    """
+
+    if by == "item":
+        return item.description
+    elif by == "type":
+        return item.type
+    elif by == "frequency":
+        return item.frequency if item.type == "routine" else None
+    return None
+
+
+def planned_minutes(data, start, end, period="day", by=None, active_only=True):
+    """
+    Computes the minutes planned for each period from start to end.
+
+    Parameters:
+        data (UserData): The data to analyse.
+        start (datetime.date): The first date of the range.
+        end (datetime.date): The last date of the range (inclusive).
+        period (str): One of VALID_PERIODS.
+        by (str): One of VALID_BREAKDOWNS.
+        active_only (bool): Whether to leave out inactive items.
+
+    Returns:
+        dict: A mapping of each period's first date to its minutes, or, when
+        by is given, to a dictionary of minutes per key. Periods are clipped
+        to the range.
+
+    Raises:
+        ValueError: if data is not valid
+        ValueError: if start or end is not valid
+        ValueError: if period or by is not valid
+    """
+
+    if not type(data) == UserData:
+        raise ValueError("Data is not valid")
+    if not is_valid_date(start) or not is_valid_date(end) or start > end:
+        raise ValueError("Range is not valid")
+    if period not in VALID_PERIODS:
+        raise ValueError("Period is not valid")
+    if by not in VALID_BREAKDOWNS:
+        raise ValueError("Breakdown is not valid")
+
+    first, last = start.toordinal(), end.toordinal()
+    days = [date.fromordinal(ordinal) for ordinal in range(first, last + 1)]
+    periods = [period_start(period, date_) for date_ in days]
+    totals = {p: {} for p in periods}
+
+    def add(p, key, minutes):
+        totals[p][key] = totals[p].get(key, 0) + minutes
+
+    # Group the routines' slot tables, and place goal minutes directly
+    tables = {}
+    for item in data.items:
+        if active_only and not item.active:
+            continue
+        key = group_key(item, by)
+        if item.type == "goal":
+            for ordinal, minutes in zip(*item.gschedule_between(start, end)):
+                add(periods[ordinal - first], key, minutes)
+        else:
+            table = tables.setdefault((key, item.frequency), {})
+            for slot, minutes in enumerate(item.rschedule_table):
+                if minutes:
+                    table[slot] = table.get(slot, 0) + minutes
+
+    # How many days of each period fall on each slot, per frequency
+    slot_counts = {}
+    for frequency in {frequency for _, frequency in tables}:
+        counts = slot_counts[frequency] = {}
+        for date_, p in zip(days, periods):
+            per_period = counts.setdefault(day_slot(frequency, date_), {})
+            per_period[p] = per_period.get(p, 0) + 1
+
+    for (key, frequency), table in tables.items():
+        counts = slot_counts[frequency]
+        for slot, minutes in table.items():
+            for p, n in counts.get(slot, {}).items():
+                add(p, key, minutes * n)
+
+    if by is None:
+        return {p: minutes.get(None, 0) for p, minutes in totals.items()}
+    return totals
+
+
+def time_distribution(data, start, end, by="item", active_only=True):
+    """
+    Computes the minutes planned from start to end in total per key.
+
+    Parameters:
+        data (UserData): The data to analyse.
+        start (datetime.date): The first date of the range.
+        end (datetime.date): The last date of the range (inclusive).
+        by (str): One of "item", "type" or "frequency".
+        active_only (bool): Whether to leave out inactive items.
+
+    Returns:
+        dict: A mapping of each key to its minutes, largest first.
+
+    Raises:
+        ValueError: if by is not valid
+    """
+
+    if by is None or by not in VALID_BREAKDOWNS:
+        raise ValueError("Breakdown is not valid")
+
+    distribution = {}
+    for minutes in planned_minutes(data, start, end, "year", by, active_only).values():
+        for key, value in minutes.items():
+            distribution[key] = distribution.get(key, 0) + value
+
+    return dict(sorted(distribution.items(), key=lambda pair: -pair[1]))
@@ -0,0 +1,100 @@
+import random
+from datetime import date, timedelta
+
+
+# Synthetic datasets for the benchmarks. The same seed always gives the same
+# items, and every item is valid, so runs can be compared between commits.
+# The mix is roughly what a real list looks like: mostly routines, most of
+# them daily or weekly, and goals that span a few weeks to a year with work
+# planned on a fraction of their days.
+
+FREQUENCY_WEIGHTS = {"day": 3, "week": 4, "month": 2, "year": 1}
+ROUTINE_SHARE = 0.6
+DURATIONS = [15, 20, 30, 45, 60, 90, 120]
+
+
+def generate_rschedule(rng, frequency):
+    """
+    Parameters:
+        rng (random.Random): The random number generator to use.
+        frequency (str): The routine's frequency.
+
+    Returns:
+        list: An rschedule compatible with the frequency.
+    """
+
+    if frequency == "day":
+        return [[0, rng.choice(DURATIONS)]]
+    elif frequency == "week":
+        slots = rng.sample(range(7), rng.randint(1, 5))
+    elif frequency == "month":
+        slots = rng.sample(range(1, 28), rng.randint(1, 3))
+    else:
+        slots = rng.sample(range(1, 365), rng.randint(1, 4))
+
+    return [[slot, rng.choice(DURATIONS)] for slot in sorted(slots)]
+
+
+def generate_goal(rng, description, today):
+    """
+    Parameters:
+        rng (random.Random): The random number generator to use.
+        description (str): The goal's description.
+        today (datetime.date): The date goals are placed around.
+
+    Returns:
+        dict: A goal with a gschedule inside its start date and deadline.
+    """
+
+    start_date = today + timedelta(days=rng.randint(-365, 365))
+    span = rng.randint(7, 365)
+    deadline = start_date + timedelta(days=span)
+    planned = rng.sample(range(span + 1), max(1, int(span * rng.uniform(0.1, 0.3))))
+    gschedule = [
+        [start_date + timedelta(days=offset), rng.choice(DURATIONS)]
+        for offset in sorted(planned)
+    ]
+
+    return {
+        "description": description,
+        "type": "goal",
+        "start_date": start_date,
+        "deadline": deadline,
+        "gschedule": gschedule,
+        "active": rng.random() < 0.9,
+    }
+
+
+def generate_data(size, seed=0, today=date(2024, 1, 1)):
+    """
+    Parameters:
+        size (int): The number of items to generate.
+        seed (int): The seed for the random number generator.
+        today (datetime.date): The date goals are placed around.
+
+    Returns:
+        dict: Valid data with size items, as UserData.from_dict expects.
+    """
+
+    rng = random.Random(seed)
+    frequencies = list(FREQUENCY_WEIGHTS)
+    weights = list(FREQUENCY_WEIGHTS.values())
+
+    items = []
+    for i in range(size):
+        description = f"item {i}"
+        if rng.random() < ROUTINE_SHARE:
+            frequency = rng.choices(frequencies, weights)[0]
+            items.append(
+                {
+                    "description": description,
+                    "type": "routine",
+                    "frequency": frequency,
+                    "rschedule": generate_rschedule(rng, frequency),
+                    "active": rng.random() < 0.9,
+                }
+            )
+        else:
+            items.append(generate_goal(rng, description, today))
+
+    return {"items": items}
@@ -0,0 +1,163 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from helpers import get_items_for_date, get_items_for_range
+from managers import add_item, delete_item, toggle_item_active, edit_item_attribute
+from models import UserData, Item, write_json_atomic
+from storage import JsonStorage
+from benchmarks.generate import generate_data
+
+
+# Times the operations that grow with the size of the data on generated
+# datasets of each size, and writes the results as JSON. Every operation is
+# repeated and its fastest and median times are reported.
+#
+#     python -m benchmarks.run --sizes 100 10000 --output results.json
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+TODAY = date(2024, 1, 1)
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(function, repeat):
+    """
+    Parameters:
+        function (function): The operation to time, called with no arguments.
+        repeat (int): How many times to run it.
+
+    Returns:
+        dict: The fastest and median times in seconds.
+    """
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"best": min(times), "median": statistics.median(times)}
+
+
+def benchmark_size(size, seed, repeat, directory):
+    """
+    Parameters:
+        size (int): The number of items in the dataset.
+        seed (int): The seed the dataset is generated with.
+        repeat (int): How many times each operation is run.
+        directory (str): A directory for the data files.
+
+    Returns:
+        dict: The timings of each operation.
+    """
+
+    raw = generate_data(size, seed, TODAY)
+    datafile = os.path.join(directory, f"data_{size}.json")
+    write_json_atomic(datafile, raw)
+    storage = JsonStorage(datafile)
+    results = {}
+
+    # Building the data validates every item, as loading does
+    results["from_dict"] = timed(lambda: UserData.from_dict(raw), repeat)
+    results["load"] = timed(storage.load, repeat)
+    data = storage.load()
+    results["validate"] = timed(
+        lambda: [item.validate() for item in data.items], repeat
+    )
+
+    days = [TODAY + timedelta(days=i) for i in range(30)]
+    results["day"] = timed(
+        lambda: [get_items_for_date(data, day) for day in days], repeat
+    )
+    results["range"] = timed(
+        lambda: get_items_for_range(data, TODAY, TODAY + timedelta(days=30)), repeat
+    )
+
+    # Each manager run leaves the data as it found it, so runs are alike
+    item = Item.from_dict(
+        {
+            "description": "benchmark",
+            "type": "routine",
+            "frequency": "week",
+            "rschedule": [[0, 30], [3, 30]],
+            "active": True,
+        }
+    )
+
+    def managers():
+        # add_item prints the item it adds
+        with contextlib.redirect_stdout(io.StringIO()):
+            add_item(data, item)
+        toggle_item_active(data, "benchmark")
+        edit_item_attribute(data, "benchmark", "rschedule", [[1, 45]])
+        edit_item_attribute(data, "benchmark", "rschedule", [[0, 30], [3, 30]])
+        toggle_item_active(data, "benchmark")
+        delete_item(data, "benchmark")
+
+    results["managers"] = timed(managers, repeat)
+    data.pending.clear()
+
+    def save():
+        toggle_item_active(data, "item 0")
+        storage.save(data)
+
+    results["save"] = timed(save, repeat)
+    results["save_compact"] = timed(lambda: storage.save(data, compact=True), repeat)
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the to-do data layer.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="file to write the results to")
+    args = parser.parse_args(argv)
+
+    if any(not 1 <= size <= 1000000 for size in args.sizes):
+        parser.error("sizes must be between 1 and 1000000")
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            print(f"Benchmarking {size} items...", file=sys.stderr)
+            results = benchmark_size(size, args.seed, args.repeat, directory)
+            report["results"][str(size)] = results
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+import json
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from validation import is_valid_duration
+from models import slot_masks
+
+
+# Actual minutes spent on items are kept in one append-only binary file per
+# item, holding (day ordinal, minutes) pairs as array("i") data sorted by day.
+# Queries read an item's file straight into two columns and work on bitsets
+# over the days of the range, so no per-record Python objects are created.
+# A names file maps descriptions to item files and follows renames.
+#
+# Names only follow renames once they are saved, so minutes spent are queued
+# and written by the save that persists the mutations made before them. The
+# prompt loop never waits on disk to record them.
+
+
+def planned_mask(item, start, end):
+    """
+    Parameters:
+        item (Item): The item to get planned days for.
+        start (datetime.date): The first date of the range.
+        end (datetime.date): The last date of the range (inclusive).
+
+    Returns:
+        int: A bitset with bit k set if the item is scheduled k days after
+        start.
+    """
+
+    # A single day is one bit test or binary search
+    if start == end:
+        return int(item.occurs_on(start))
+    if item.type == "routine":
+        return item.occurrence_mask(slot_masks(item.frequency, start, end))
+
+    first = start.toordinal()
+    mask = 0
+    for day in item.gschedule_between(start, end)[0]:
+        mask |= 1 << day - first
+    return mask
+
+
+def planned_total(item, start, end):
+    """
+    Parameters:
+        item (Item): The item to get planned minutes for.
+        start (datetime.date): The first date of the range.
+        end (datetime.date): The last date of the range (inclusive).
+
+    Returns:
+        int: The minutes planned for the item over the range.
+    """
+
+    if item.type == "goal":
+        if start == end:
+            return item.minutes_on(start)
+        return sum(item.gschedule_between(start, end)[1])
+    if start == end:
+        return item.routine_minutes_on(start)
+
+    masks = slot_masks(item.frequency, start, end)
+    return sum(
+        masks.get(slot, 0).bit_count() * minutes
+        for slot, minutes in enumerate(item.rschedule_table)
+        if minutes
+    )
+
+
+class CompletionLog:
+    def __init__(self, directory):
+        self.directory = directory
+        self.names_path = os.path.join(directory, "names.jsonl")
+        self.ids = None
+        self.next_id = 0
+        self.cache = {}
+        # (last record logged before, description, date, minutes) waiting
+        # for that record to be saved
+        self.queued = []
+        # Held while queueing and while applying saved records
+        self.lock = threading.Lock()
+
+    # Recording
+
+    def queue(self, description, date_, minutes, after):
+        """
+        Queues minutes spent on an item, to be recorded by apply once the
+        journal records logged before them have been saved.
+
+        Parameters:
+            description (str): The description of the item.
+            date_ (datetime.date): The date the minutes were spent on.
+            minutes (int): The minutes spent.
+            after (dict): The last journal record logged before the minutes
+                were spent (UserData.last_mutation), or None.
+
+        Raises:
+            ValueError: if minutes is not valid
+        """
+
+        if not isinstance(minutes, int) or not is_valid_duration(minutes):
+            raise ValueError("minutes is not valid")
+
+        with self.lock:
+            self.queued.append((after, description, date_, minutes))
+
+    def record(self, description, date_, minutes):
+        """
+        Records minutes spent on an item on a date.
+
+        Parameters:
+            description (str): The description of the item.
+            date_ (datetime.date): The date the minutes were spent on.
+            minutes (int): The minutes spent.
+
+        Raises:
+            ValueError: if minutes is not valid
+        """
+
+        if not isinstance(minutes, int) or not is_valid_duration(minutes):
+            raise ValueError("minutes is not valid")
+
+        id_ = self.item_id(description, create=True)
+        days, spent = self.columns_for_id(id_)
+        ordinal = date_.toordinal()
+        i = bisect_right(days, ordinal)
+        days.insert(i, ordinal)
+        spent.insert(i, minutes)
+
+        if i == len(days) - 1:
+            with open(self.item_path(id_), "ab") as f:
+                array("i", [ordinal, minutes]).tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            # Backfilled records rewrite the file to keep it sorted
+            pairs = array("i", [0]) * (2 * len(days))
+            pairs[0::2], pairs[1::2] = days, spent
+            tmp = self.item_path(id_) + ".tmp"
+            with open(tmp, "wb") as f:
+                pairs.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.item_path(id_))
+
+    def apply(self, records, unsaved=()):
+        """
+        Follows renames and deletions in journal records, so completions stay
+        with the item they were recorded for, and records queued minutes in
+        order with them.
+
+        Parameters:
+            records (list): Saved journal records, in the order they were made.
+            unsaved (list): Journal records not saved yet. Minutes queued
+                after any of them stay queued.
+        """
+
+        with self.lock:
+            # Minutes queued after records saved earlier came before these
+            seen = {id(record) for record in records}
+            seen.update(id(record) for record in unsaved)
+            self.flush(lambda after: id(after) not in seen)
+
+            for record in records:
+                if record["op"] == "delete":
+                    self.set_name(record["description"], None)
+                elif record["op"] == "set" and record["attribute"] == "description":
+                    old, new = record["description"], record["value"]
+                    # A new item may already have taken the name; it keeps it
+                    if self.item_id(new) is None:
+                        self.set_name(new, self.item_id(old))
+                    self.set_name(old, None)
+                self.flush(lambda after: after is record)
+
+    # Queries
+
+    def actual_minutes(self, description, start, end):
+        """
+        Parameters:
+            description (str): The description of the item.
+            start (datetime.date): The first date of the range.
+            end (datetime.date): The last date of the range (inclusive).
+
+        Returns:
+            int: The minutes recorded for the item over the range.
+        """
+
+        days, spent = self.columns(description)
+        lo = bisect_left(days, start.toordinal())
+        hi = bisect_right(days, end.toordinal())
+        return sum(spent[lo:hi])
+
+    def done_mask(self, description, start, end):
+        """
+        Returns:
+            int: A bitset with bit k set if minutes were recorded for the item
+            k days after start.
+        """
+
+        days, spent = self.columns(description)
+        first = start.toordinal()
+        lo, hi = bisect_left(days, first), bisect_right(days, end.toordinal())
+        mask = 0
+        for day, minutes in zip(days[lo:hi], spent[lo:hi]):
+            if minutes:
+                mask |= 1 << day - first
+        return mask
+
+    def completion_rate(self, item, start, end):
+        """
+        Parameters:
+            item (Item): The item to check.
+            start (datetime.date): The first date of the range.
+            end (datetime.date): The last date of the range (inclusive).
+
+        Returns:
+            float: The share of the item's scheduled days in the range with
+            minutes recorded, or None if nothing was scheduled.
+        """
+
+        planned = planned_mask(item, start, end)
+        if not planned:
+            return None
+        done = self.done_mask(item.description, start, end)
+        return (planned & done).bit_count() / planned.bit_count()
+
+    def current_streak(self, item, today):
+        """
+        Parameters:
+            item (Item): The item to check.
+            today (datetime.date): The day to count back from. It doesn't
+                break the streak if nothing has been recorded for it yet.
+
+        Returns:
+            int: The number of consecutive scheduled days, up to today, with
+            minutes recorded.
+        """
+
+        days, _ = self.columns(item.description)
+        if not days:
+            return 0
+
+        start = min(today, type(today).fromordinal(days[0]))
+        planned = planned_mask(item, start, today)
+        done = self.done_mask(item.description, start, today)
+        last = 1 << (today - start).days
+        if not done & last:
+            planned &= ~last
+
+        missed = planned & ~done
+        if not missed:
+            return planned.bit_count()
+        return (planned >> missed.bit_length()).bit_count()
+
+    def longest_streak(self, item, start, end):
+        """
+        Parameters:
+            item (Item): The item to check.
+            start (datetime.date): The first date of the range.
+            end (datetime.date): The last date of the range (inclusive).
+
+        Returns:
+            int: The most consecutive scheduled days in the range with minutes
+            recorded.
+        """
+
+        planned = planned_mask(item, start, end)
+        done = self.done_mask(item.description, start, end)
+        longest = run = 0
+        for offset, bit in enumerate(reversed(bin(planned)[2:])):
+            if bit == "1":
+                run = run + 1 if done >> offset & 1 else 0
+                longest = max(longest, run)
+        return longest
+
+    def planned_vs_actual(self, item, start, end):
+        """
+        Parameters:
+            item (Item): The item to check.
+            start (datetime.date): The first date of the range.
+            end (datetime.date): The last date of the range (inclusive).
+
+        Returns:
+            tuple: The minutes planned and the minutes recorded over the range.
+        """
+
+        return (
+            planned_total(item, start, end),
+            self.actual_minutes(item.description, start, end),
+        )
+
+    # Internal helpers
+
+    def flush(self, ready):
+        queued, self.queued = self.queued, []
+        for after, description, date_, minutes in queued:
+            if ready(after):
+                self.record(description, date_, minutes)
+            else:
+                self.queued.append((after, description, date_, minutes))
+
+    def load_names(self):
+        self.ids = {}
+        try:
+            with open(self.names_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["id"] is None:
+                        self.ids.pop(entry["description"], None)
+                    else:
+                        self.ids[entry["description"]] = entry["id"]
+                        self.next_id = max(self.next_id, entry["id"] + 1)
+        except FileNotFoundError:
+            pass
+
+    def item_id(self, description, create=False):
+        if self.ids is None:
+            self.load_names()
+        if description not in self.ids and create:
+            self.set_name(description, self.next_id)
+            self.next_id += 1
+        return self.ids.get(description)
+
+    def set_name(self, description, id_):
+        if self.ids is None:
+            self.load_names()
+        if id_ is None:
+            if self.ids.pop(description, None) is None:
+                return
+        else:
+            self.ids[description] = id_
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.names_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"description": description, "id": id_}) + "\n")
+
+    def item_path(self, id_):
+        return os.path.join(self.directory, f"{id_}.bin")
+
+    def columns(self, description):
+        id_ = self.item_id(description)
+        if id_ is None:
+            return array("i"), array("i")
+        return self.columns_for_id(id_)
+
+    def columns_for_id(self, id_):
+        if id_ not in self.cache:
+            pairs = array("i")
+            try:
+                with open(self.item_path(id_), "rb") as f:
+                    raw = f.read()
+            except FileNotFoundError:
+                raw = b""
+            # Drop a pair that was only partly written, cutting it off the
+            # file too so later appends stay aligned
+            valid = len(raw) - len(raw) % (2 * pairs.itemsize)
+            if valid < len(raw):
+                os.truncate(self.item_path(id_), valid)
+            pairs.frombytes(raw[:valid])
+            self.cache[id_] = (pairs[0::2], pairs[1::2])
+        return self.cache[id_]
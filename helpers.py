@@ -1,6 +1,7 @@
 from validation import *
+from bisect import bisect_left
 from datetime import date, datetime
-from models import UserData
+from models import UserData, day_slot, slot_mask
 
 
 # Helpers
@@ -12,17 +13,13 @@ def get_item(item_desc, data):
 
     Parameters:
         item_desc (str): The description of the item to get.
-        data (list): The data to get the item from.
+        data (UserData): The data to get the item from.
 
     Returns:
-        dict: The item with the given description, None if not found.
+        Item: The item with the given description, None if not found.
     """
 
-    for item in data["items"]:
-        if item["description"] == item_desc:
-            return item
-
-    return None
+    return data.get_item(item_desc)
 
 
 def get_compatibility_dict(item):
@@ -30,20 +27,20 @@ def get_compatibility_dict(item):
     Gets a compatibility dictionary for the given item.
 
     Parameters:
-        item (dict): The item to get a compatibility dictionary for.
+        item (Item): The item to get a compatibility dictionary for.
 
     Returns:
         dict: A compatibility dictionary for the given item.
     """
 
-    if item["type"] == "goal":
+    if item.type == "goal":
         return {
-            "gschedule": item["gschedule"],
-            "start_date": item["start_date"],
-            "deadline": item["deadline"],
+            "gschedule": item.gschedule,
+            "start_date": item.start_date,
+            "deadline": item.deadline,
         }
-    elif item["type"] == "routine":
-        return {"rschedule": item["rschedule"], "frequency": item["frequency"]}
+    elif item.type == "routine":
+        return {"rschedule": item.rschedule, "frequency": item.frequency}
 
 
 def get_items_for_date(data, date_):
@@ -65,23 +62,44 @@ def get_items_for_date(data, date_):
     if not type(date_) == date:
         raise ValueError("Date is not valid")
 
-    items = []
+    return data.occurrences.items_for_date(date_)
+
+
+def get_items_for_range(data, start, end):
+    """
+    Gets the items for every date from start to end in a single pass.
+
+    Parameters:
+        data (UserData): The data to get items from.
+        start (datetime.date): The first date of the range.
+        end (datetime.date): The last date of the range (inclusive).
+
+    Returns:
+        dict: A mapping of datetime.date to a list of items, containing only
+        the dates on which at least one item falls, in date order.
+
+    Raises:
+        ValueError: if data is not valid
+        ValueError: if start or end is not valid
+        ValueError: if start is after end
+    """
 
-    for item in data.items:
-        if item.type == "goal":
-            if date_in_gschedule(item.gschedule, date_):
-                items.append(item)
-        elif item.type == "routine":
-            if date_in_rschedule(item.frequency, item.rschedule, date_):
-                items.append(item)
+    if not type(data) == UserData:
+        raise ValueError("Data is not valid")
+    if not type(start) == date or not type(end) == date:
+        raise ValueError("Date is not valid")
+    if start > end:
+        raise ValueError("Start is after end")
 
-    return items
+    return data.occurrences.items_for_range(start, end)
 
 
 def date_in_gschedule(gschedule, date_):
     """
     Parameters:
-        gschedule (list): A list of lists containing a date and time.
+        gschedule (list): A list of lists containing a date and time, sorted by
+            date as Item.gschedule is. For an Item, Item.scheduled_on searches
+            its columns without building this list.
         date (datetime.date): The date to check.
 
     Returns:
@@ -94,18 +112,16 @@ def date_in_gschedule(gschedule, date_):
     if not is_valid_date(date_):
         raise ValueError("Date is not valid")
 
-    for item in gschedule:
-        if item[0] == date_:
-            return True
-
-    return False
+    i = bisect_left(gschedule, date_, key=lambda spec: spec[0])
+    return i < len(gschedule) and gschedule[i][0] == date_
 
 
 def date_in_rschedule(frequency, rschedule, date_):
     """
     Parameters:
         frequency (str): The frequency of the rschedule.
-        rschedule (list): A list of lists containing a time.
+        rschedule (list or int): A list of lists containing a slot and a
+            time, or the bitmask an Item compiles it into (rschedule_mask).
         date (datetime.date): The date to check.
 
     Returns:
@@ -113,46 +129,28 @@ def date_in_rschedule(frequency, rschedule, date_):
 
     Raises:
         ValueError: if frequency is not valid
-        ValueError: if rschedule is not valid
         ValueError: if date is not valid
     """
 
     if not is_valid_frequency(frequency):
         raise ValueError("frequency is not valid")
-    if not is_valid_rschedule(rschedule):
-        raise ValueError("rschedule is not valid")
     if not is_valid_date(date_):
         raise ValueError("Date is not valid")
 
     if frequency == "day":
         return True
 
-    if frequency == "week":
-        day = date_.weekday()
-        for item in rschedule:
-            if item[0] == day:
-                return True
-
-    if frequency == "month":
-        day = date_.day
-        for item in rschedule:
-            if item[0] == day:
-                return True
-
-    if frequency == "year":
-        day = date_.timetuple().tm_yday
-        for item in rschedule:
-            if item[0] == day:
-                return True
-
-    return False
+    mask = rschedule
+    if not isinstance(mask, int):
+        mask = slot_mask(spec[0] for spec in rschedule)
+    return mask >> day_slot(frequency, date_) & 1 == 1
 
 
 def item_in_data(data, item_desc):
     """
     Parameters:
-        data (dict): The data to check for the description in.
-        item_desc (int): The id of the item to check for.
+        data (UserData): The data to check for the description in.
+        item_desc (str): The description of the item to check for.
 
     Returns:
         bool: True if the description exists, False otherwise.
@@ -162,13 +160,9 @@ def item_in_data(data, item_desc):
         ValueError: if item_desc is not valid
     """
 
-    if not is_valid_data(data):
+    if not type(data) == UserData:
         raise ValueError("Data is not valid")
     if not is_valid_description(item_desc):
         raise ValueError("item_desc is not valid")
 
-    for item in data["items"]:
-        if item["description"] == item_desc:
-            return True
-
-    return False
+    return data.get_item(item_desc) is not None
@@ -0,0 +1,193 @@
+import json
+import math
+import os
+import time
+from bisect import bisect_right
+from datetime import datetime
+from models import UserData, date_converter
+from journal import apply_record
+from storage import decode_data, decode_record
+
+
+# Every saved mutation is appended to a history log as a timestamped event,
+# one JSON object per line, and is never rewritten. Every SNAPSHOT_INTERVAL
+# events a full snapshot is appended as well, and its time and byte offset
+# go in a small index file, so rebuilding a past state only replays the
+# events since the nearest earlier snapshot.
+
+SNAPSHOT_INTERVAL = 1000
+
+
+def microseconds(timestamp):
+    # Rounded the way datetime.fromtimestamp rounds, so an event's time given
+    # back as a datetime still matches the event
+    fraction, whole = math.modf(timestamp)
+    return int(whole) * 1000000 + round(fraction * 1e6)
+
+
+class History:
+    def __init__(self, path, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.snapshot_interval = snapshot_interval
+        # Events since the last snapshot, counted on first use
+        self.since_snapshot = None
+
+    def start(self, data):
+        """
+        Begins the history with a snapshot of the data if there is none yet.
+
+        Parameters:
+            data (UserData): The data as loaded, with no pending mutations.
+        """
+
+        if not os.path.exists(self.path):
+            self.append_snapshot(time.time(), data.to_dict()["items"])
+
+    def record(self, events):
+        """
+        Appends events to the history, adding a snapshot when enough events
+        have accumulated since the last one.
+
+        Parameters:
+            events (list): Journal records, each with a "time".
+        """
+
+        if not events:
+            return
+
+        if self.since_snapshot is None:
+            self.since_snapshot = sum(1 for _ in self.read_from(self.last_offset()))
+
+        lines = [json.dumps(event, default=date_converter) + "\n" for event in events]
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+        self.since_snapshot += len(events)
+
+        if self.since_snapshot >= self.snapshot_interval:
+            state = self.state_at(None)
+            self.append_snapshot(events[-1]["time"], state.to_dict()["items"])
+
+    def state_at(self, when):
+        """
+        Rebuilds the data as it was at a past time.
+
+        Parameters:
+            when (float or datetime.datetime): The time to rebuild the data
+                at, as a time.time() timestamp like the events' times, or
+                None for the latest recorded state. The state includes any
+                event at exactly that time.
+
+        Returns:
+            UserData: The data as it was at that time.
+        """
+
+        # Times are compared in whole microseconds, the precision of datetime
+        if when is None:
+            cutoff = math.inf
+        elif isinstance(when, datetime):
+            second = when.replace(microsecond=0).timestamp()
+            cutoff = int(second) * 1000000 + when.microsecond
+        else:
+            cutoff = microseconds(when)
+        entries = self.read_index()
+        times = [microseconds(entry["time"]) for entry in entries]
+        i = bisect_right(times, cutoff) - 1
+        offset = entries[i]["offset"] if i >= 0 else 0
+
+        data = UserData({"items": []})
+        for record in self.read_from(offset, snapshots=True):
+            if microseconds(record["time"]) > cutoff:
+                break
+            if record["op"] == "snapshot":
+                data = decode_data({"items": record["items"]})
+            else:
+                apply_record(data, decode_record(record))
+        data.pending.clear()
+
+        return data
+
+    def item_history(self, description):
+        """
+        Gets the events that changed an item, following renames.
+
+        Parameters:
+            description (str): The item's current description, or its last
+                description if it has been deleted.
+
+        Returns:
+            list: The item's events in the order they happened.
+        """
+
+        ids, events, last_id = {}, {}, None
+        started = False
+        for record in self.read_from(0, snapshots=True):
+            op = record["op"]
+            if op == "snapshot":
+                # Only the first snapshot introduces items; later ones repeat
+                # state the events already describe
+                if not started:
+                    for item in record["items"]:
+                        ids[item["description"]] = len(events)
+                        events[len(events)] = []
+                started = True
+                continue
+
+            started = True
+            if op == "add":
+                name = record["item"]["description"]
+                ids[name] = len(events)
+                events[ids[name]] = []
+            else:
+                name = record["description"]
+            if name not in ids:
+                continue
+
+            id_ = ids[name]
+            events[id_].append(decode_record(record))
+            if op == "delete":
+                del ids[name]
+            elif op == "set" and record["attribute"] == "description":
+                ids[record["value"]] = ids.pop(name)
+                name = record["value"]
+            if name == description:
+                last_id = id_
+
+        id_ = ids.get(description, last_id)
+        return events[id_] if id_ is not None else []
+
+    # Internal helpers
+
+    def append_snapshot(self, timestamp, items):
+        record = {"op": "snapshot", "time": timestamp, "items": items}
+        with open(self.path, "a", encoding="utf-8") as f:
+            offset = f.tell()
+            f.write(json.dumps(record, default=date_converter) + "\n")
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"time": timestamp, "offset": offset}) + "\n")
+        self.since_snapshot = 0
+
+    def read_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return [json.loads(line) for line in f]
+        except FileNotFoundError:
+            return []
+
+    def last_offset(self):
+        entries = self.read_index()
+        return entries[-1]["offset"] if entries else 0
+
+    def read_from(self, offset, snapshots=False):
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        return
+                    if snapshots or record["op"] != "snapshot":
+                        yield record
+        except FileNotFoundError:
+            return
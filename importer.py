@@ -0,0 +1,288 @@
+import csv
+import json
+import re
+from datetime import date, datetime, timedelta
+from models import Item, day_slot
+from managers import Batch
+
+
+# Bulk import of goals and routines from CSV and iCalendar files. Records are
+# read one at a time and turned into Items as they stream past, which
+# validates each one, and the whole import is queued on a single Batch so it
+# is applied all or nothing and persisted with one save.
+#
+# CSV files have a header naming item attributes: description, type, active,
+# frequency, rschedule, start_date, deadline and gschedule. Schedules are
+# written as in the CLI, e.g. [[0, 30]] or [["2024-01-05", 60]].
+#
+# In .ics files each VEVENT becomes an item named after its SUMMARY, cut to
+# 15 characters. Events repeating forever become routines; one-off events and
+# events repeating a fixed number of times become goals scheduled on each
+# occurrence. Minutes come from DTEND or DURATION.
+
+VALID_FORMATS = ["csv", "ics"]
+RRULE_FREQUENCIES = {
+    "DAILY": "day",
+    "WEEKLY": "week",
+    "MONTHLY": "month",
+    "YEARLY": "year",
+}
+ICS_WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+# Finite recurrences are expanded into goal schedules up to this many days
+MAX_EXPANSION_DAYS = 10 * 366
+
+
+def import_items(data, filename, save=None, skip_invalid=False):
+    """
+    Imports the items in a CSV or .ics file into the data.
+
+    Parameters:
+        data (UserData): The data to import into.
+        filename (str): The file to import, ending in .csv or .ics.
+        save (function): Called once with the data after importing, if given.
+        skip_invalid (bool): Whether to leave out records that can't be
+            imported instead of importing nothing.
+
+    Returns:
+        tuple: The number of items imported and a list of error messages,
+        one per record left out.
+
+    Raises:
+        ValueError: if the file format is not valid
+        ValueError: if a record is not valid and skip_invalid is False
+    """
+
+    file_format = filename.rsplit(".", 1)[-1].lower()
+    if file_format not in VALID_FORMATS:
+        raise ValueError("File format is not valid")
+
+    batch = Batch(data)
+    seen, errors = set(), []
+    with open(filename, "r", encoding="utf-8", newline="") as f:
+        records = read_csv(f) if file_format == "csv" else read_ics(f)
+        for line, record in records:
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                item = Item.from_dict(record)
+                if item.description in seen or data.get_item(item.description):
+                    raise ValueError("Duplicate description")
+            except (ValueError, TypeError, KeyError) as e:
+                if not skip_invalid:
+                    raise ValueError(f"Line {line}: {e}") from e
+                errors.append(f"Line {line}: {e}")
+                continue
+            seen.add(item.description)
+            batch.add_item(item)
+
+    batch.commit(save)
+    return len(seen), errors
+
+
+def read_csv(f):
+    """
+    Parameters:
+        f (file): An open CSV file.
+
+    Yields:
+        tuple: The line number of each row and the row as an item dictionary,
+        or a ValueError if the row can't be parsed.
+    """
+
+    reader = csv.DictReader(f)
+    for row in reader:
+        line = reader.line_num
+        try:
+            item = {
+                "description": row["description"],
+                "type": row["type"],
+                "active": parse_active(row.get("active")),
+            }
+            if item["type"] == "routine":
+                item["frequency"] = row["frequency"]
+                item["rschedule"] = json.loads(row["rschedule"])
+            elif item["type"] == "goal":
+                item["start_date"] = date.fromisoformat(row["start_date"])
+                item["deadline"] = date.fromisoformat(row["deadline"])
+                item["gschedule"] = [
+                    [date.fromisoformat(spec[0]), spec[1]]
+                    for spec in json.loads(row["gschedule"] or "[]")
+                ]
+        except KeyError as e:
+            yield line, ValueError(f"Missing field {e}")
+            continue
+        except (IndexError, TypeError, ValueError) as e:
+            yield line, ValueError(str(e))
+            continue
+        yield line, item
+
+
+def read_ics(f):
+    """
+    Parameters:
+        f (file): An open iCalendar file.
+
+    Yields:
+        tuple: The line number each VEVENT starts on and the event as an item
+        dictionary, or a ValueError if the event can't be converted.
+    """
+
+    # Components nested in an event, such as VALARMs, have properties of
+    # their own, so only those at the event's own level are kept
+    event, start_line, depth = None, None, 0
+    for line, (name, params, value) in unfold_ics(f):
+        if name == "BEGIN" and value == "VEVENT":
+            event, start_line, depth = {}, line, 0
+        elif event is None:
+            continue
+        elif name == "BEGIN":
+            depth += 1
+        elif name == "END" and depth:
+            depth -= 1
+        elif name == "END" and value == "VEVENT":
+            try:
+                item = event_to_item(event)
+            except KeyError as e:
+                item = ValueError(f"Missing field {e}")
+            except (IndexError, TypeError, ValueError) as e:
+                item = ValueError(str(e))
+            yield start_line, item
+            event = None
+        elif depth == 0:
+            event.setdefault(name, (params, value))
+
+
+# Internal helpers
+
+
+def parse_active(value):
+    value = (value or "true").strip().lower()
+    if value in {"true", "yes", "1"}:
+        return True
+    if value in {"false", "no", "0"}:
+        return False
+    raise ValueError("Invalid active status")
+
+
+def unfold_ics(f):
+    # Content lines may be folded onto following lines starting with a space
+    # or tab. Yields the line number, name, parameters and value of each
+    pending, pending_line = None, 0
+    for number, raw in enumerate(f, start=1):
+        raw = raw.rstrip("\r\n")
+        if raw[:1] in {" ", "\t"} and pending is not None:
+            pending += raw[1:]
+            continue
+        if pending:
+            yield pending_line, split_content_line(pending)
+        pending, pending_line = raw, number
+    if pending:
+        yield pending_line, split_content_line(pending)
+
+
+def split_content_line(content):
+    head, _, value = content.partition(":")
+    name, *params = head.split(";")
+    return name.upper(), dict(p.partition("=")[::2] for p in params), value
+
+
+def parse_ics_datetime(value):
+    # Returns the date and, for date-times, the datetime (times are taken as
+    # written; time zones don't affect which day an item falls on here)
+    day = datetime.strptime(value[:8], "%Y%m%d").date()
+    if "T" not in value:
+        return day, None
+    return day, datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+
+
+def parse_ics_duration(value):
+    match = re.fullmatch(
+        r"[+]?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?", value
+    )
+    if not match:
+        raise ValueError("Invalid DURATION")
+    weeks, days, hours, minutes, _ = (int(g or 0) for g in match.groups())
+    return ((weeks * 7 + days) * 24 + hours) * 60 + minutes
+
+
+def event_to_item(event):
+    summary = event["SUMMARY"][1].strip()
+    start, start_time = parse_ics_datetime(event["DTSTART"][1])
+
+    minutes = 0
+    if "DURATION" in event:
+        minutes = parse_ics_duration(event["DURATION"][1])
+    elif "DTEND" in event and start_time is not None:
+        _, end_time = parse_ics_datetime(event["DTEND"][1])
+        minutes = int((end_time - start_time).total_seconds() // 60)
+
+    item = {"description": summary[:15], "active": True}
+    if "RRULE" not in event:
+        item.update(
+            type="goal", start_date=start, deadline=start, gschedule=[[start, minutes]]
+        )
+        return item
+
+    rule = dict(part.partition("=")[::2] for part in event["RRULE"][1].split(";"))
+    frequency = RRULE_FREQUENCIES.get(rule.get("FREQ"))
+    if frequency is None:
+        raise ValueError(f"Unsupported RRULE frequency {rule.get('FREQ')}")
+    interval = int(rule.get("INTERVAL", 1))
+    weekdays = [start.weekday()]
+    if "BYDAY" in rule and frequency == "week":
+        weekdays = [ICS_WEEKDAYS.index(day[-2:]) for day in rule["BYDAY"].split(",")]
+    month_day = int(rule.get("BYMONTHDAY", start.day))
+
+    if "COUNT" not in rule and "UNTIL" not in rule:
+        if interval != 1:
+            raise ValueError("Repeating forever with an INTERVAL is not supported")
+        if frequency == "day":
+            slots = [0]
+        elif frequency == "week":
+            slots = weekdays
+        elif frequency == "month":
+            slots = [month_day]
+        else:
+            slots = [day_slot("year", start)]
+        item.update(
+            type="routine",
+            frequency=frequency,
+            rschedule=[[slot, minutes] for slot in sorted(set(slots))],
+        )
+        return item
+
+    count = int(rule["COUNT"]) if "COUNT" in rule else None
+    until = parse_ics_datetime(rule["UNTIL"])[0] if "UNTIL" in rule else None
+    week_start = start - timedelta(days=start.weekday())
+    gschedule = []
+    for offset in range(MAX_EXPANSION_DAYS):
+        day = start + timedelta(days=offset)
+        if until is not None and day > until:
+            break
+        if frequency == "day":
+            matches = offset % interval == 0
+        elif frequency == "week":
+            weeks = (day - week_start).days // 7
+            matches = day.weekday() in weekdays and weeks % interval == 0
+        elif frequency == "month":
+            months = (day.year - start.year) * 12 + day.month - start.month
+            matches = day.day == month_day and months % interval == 0
+        else:
+            years = day.year - start.year
+            matches = (day.month, day.day) == (start.month, start.day) and (
+                years % interval == 0
+            )
+        if matches:
+            gschedule.append([day, minutes])
+            if count is not None and len(gschedule) == count:
+                break
+
+    if not gschedule:
+        raise ValueError("Event has no occurrences")
+    item.update(
+        type="goal",
+        start_date=gschedule[0][0],
+        deadline=gschedule[-1][0],
+        gschedule=gschedule,
+    )
+    return item
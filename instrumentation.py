@@ -0,0 +1,152 @@
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+
+# Opt-in timing of the hot paths. Enabling swaps each instrumented function
+# for a wrapper wherever the program holds a reference to it, including the
+# copies made by "from module import *", and disabling swaps the originals
+# back, so nothing is measured or slowed down while it is off. Times include
+# the time spent in other instrumented functions called along the way.
+
+INSTRUMENTED_MODULES = ["managers", "helpers", "validation"]
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = [1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0, float("inf")]
+BUCKET_LABELS = ["1us", "10us", "100us", "1ms", "10ms", "100ms", "1s", "10s", "inf"]
+
+stats = {}
+# Qualified name -> (original, wrapper)
+wrapped = {}
+lock = threading.Lock()
+
+
+def enabled():
+    return bool(wrapped)
+
+
+def enable(extra=None):
+    """
+    Starts timing every function defined in INSTRUMENTED_MODULES.
+
+    Parameters:
+        extra (dict): Further functions to time, as a mapping of module name
+            to a list of function names.
+    """
+
+    targets = {name: None for name in INSTRUMENTED_MODULES}
+    targets.update(extra or {})
+
+    with lock:
+        for module_name, names in targets.items():
+            module = sys.modules.get(module_name)
+            if module is None:
+                continue
+            if names is None:
+                names = [
+                    name
+                    for name, value in vars(module).items()
+                    if inspect.isfunction(value) and value.__module__ == module_name
+                ]
+            for name in names:
+                qualified = f"{module.__name__}.{name}"
+                if qualified in wrapped:
+                    continue
+                original = getattr(module, name)
+                wrapper = wrap(qualified, original)
+                wrapped[qualified] = (original, wrapper)
+                replace(original, wrapper)
+
+
+def disable():
+    """
+    Stops timing, restoring the original functions. Collected stats are kept.
+    """
+
+    with lock:
+        for original, wrapper in wrapped.values():
+            replace(wrapper, original)
+        wrapped.clear()
+
+
+def reset():
+    # Wrappers hold on to their stats, so they are zeroed rather than dropped
+    with lock:
+        for stat in stats.values():
+            stat.update(count=0, total=0.0, histogram=[0] * len(BUCKETS))
+
+
+def report():
+    """
+    Returns:
+        dict: For each function called while timing was on, its call count,
+        total and mean time in seconds, and the number of calls falling in
+        each latency bucket, slowest total first.
+    """
+
+    with lock:
+        entries = {
+            name: {
+                "count": stat["count"],
+                "total_seconds": stat["total"],
+                "mean_seconds": stat["total"] / stat["count"],
+                "histogram": dict(zip(BUCKET_LABELS, stat["histogram"])),
+            }
+            for name, stat in stats.items()
+            if stat["count"]
+        }
+
+    return dict(sorted(entries.items(), key=lambda pair: -pair[1]["total_seconds"]))
+
+
+def dump(filename):
+    """
+    Writes the report to a JSON file.
+
+    Parameters:
+        filename (str): The file to write.
+    """
+
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(report(), f, indent=2)
+
+
+# Internal helpers
+
+
+def wrap(qualified, function):
+    stat = stats.setdefault(
+        qualified, {"count": 0, "total": 0.0, "histogram": [0] * len(BUCKETS)}
+    )
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with lock:
+                stat["count"] += 1
+                stat["total"] += elapsed
+                stat["histogram"][bisect_left(BUCKETS, elapsed)] += 1
+
+    return wrapper
+
+
+def replace(old, new):
+    # Only the program's own modules hold references worth replacing
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if not path or os.path.dirname(os.path.abspath(path)) != directory:
+            continue
+        namespace = vars(module)
+        for name, value in list(namespace.items()):
+            if value is old:
+                namespace[name] = new
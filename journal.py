@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+from models import Item, date_converter, write_json_atomic
+
+
+# Mutations are appended to a log next to the data file, one JSON record per
+# line, and folded into a fresh snapshot once the log outgrows the snapshot.
+# The log opens with a "base" record naming the snapshot it applies to, so a
+# crash between replacing the snapshot and removing the log can't replay the
+# old log onto the new snapshot.
+
+COMPACT_MIN_BYTES = 64 * 1024
+
+
+def journal_path(datafile):
+    """
+    Parameters:
+        datafile (str): The path of the snapshot file.
+
+    Returns:
+        str: The path of the journal kept next to the snapshot.
+    """
+
+    return datafile + ".log"
+
+
+def snapshot_fingerprint(datafile):
+    """
+    Parameters:
+        datafile (str): The path of the snapshot file.
+
+    Returns:
+        list: The size and modification time of the snapshot.
+    """
+
+    stat = os.stat(datafile)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def append_records(datafile, records):
+    """
+    Appends records to the journal, one JSON object per line, and flushes them
+    to disk.
+
+    Parameters:
+        datafile (str): The path of the snapshot file.
+        records (list): The records to append.
+    """
+
+    if not records:
+        return
+
+    lines = [json.dumps(record, default=date_converter) + "\n" for record in records]
+    with open(journal_path(datafile), "a", encoding="utf-8") as f:
+        if f.tell() == 0:
+            base = {"op": "base", "snapshot": snapshot_fingerprint(datafile)}
+            lines.insert(0, json.dumps(base) + "\n")
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_records(datafile, object_hook=None):
+    """
+    Reads the records in the journal, in the order they were appended.
+
+    Parameters:
+        datafile (str): The path of the snapshot file.
+        object_hook (function): Passed on to json.loads for each record.
+
+    Returns:
+        list: The records, empty if there is no journal or it belongs to an
+        older snapshot. A final record that was only partly written is dropped.
+    """
+
+    records = []
+    try:
+        with open(journal_path(datafile), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line, object_hook=object_hook))
+                except json.JSONDecodeError:
+                    break
+    except FileNotFoundError:
+        return []
+
+    if not records or records[0].get("op") != "base":
+        return []
+    if records[0].get("snapshot") != snapshot_fingerprint(datafile):
+        return []
+
+    return records[1:]
+
+
+def write_snapshot(datafile, snapshot):
+    """
+    Atomically replaces the snapshot and discards the journal it supersedes.
+
+    Parameters:
+        datafile (str): The path of the snapshot file.
+        snapshot (dict): The data, as a dictionary, to write.
+    """
+
+    write_json_atomic(datafile, snapshot)
+    try:
+        os.remove(journal_path(datafile))
+    except FileNotFoundError:
+        pass
+
+
+def apply_record(data, record):
+    """
+    Replays a journal record onto the data.
+
+    Parameters:
+        data (UserData): The data to apply the record to.
+        record (dict): The record to apply.
+
+    Raises:
+        ValueError: if record is not valid
+    """
+
+    op = record.get("op")
+    if op == "add":
+        data.add_item(Item.from_dict(record["item"]))
+    elif op == "delete":
+        data.remove_item(record["description"])
+    elif op == "set":
+        data.set_item_attribute(
+            record["description"], record["attribute"], record["value"]
+        )
+    else:
+        raise ValueError("Invalid journal record")
+
+
+def needs_compaction(datafile):
+    """
+    Parameters:
+        datafile (str): The path of the snapshot file.
+
+    Returns:
+        bool: True if there is no snapshot yet or the journal has outgrown it,
+        False otherwise.
+    """
+
+    if not os.path.exists(datafile):
+        return True
+    try:
+        log_size = os.path.getsize(journal_path(datafile))
+    except FileNotFoundError:
+        return False
+
+    return log_size > max(COMPACT_MIN_BYTES, os.path.getsize(datafile))
+
+
+# Saves in the background after mutations settle, so interactive code only
+# has to call notify(). Call stop() before saving from any other thread.
+class Autosaver(threading.Thread):
+    def __init__(self, save, delay=1.0):
+        super().__init__(daemon=True)
+        self.save = save
+        self.delay = delay
+        self.changed = threading.Event()
+        self.stopped = threading.Event()
+
+    def notify(self):
+        self.changed.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.changed.wait()
+            # Coalesce a burst of mutations into a single save
+            self.stopped.wait(self.delay)
+            self.changed.clear()
+            # An error must not end the thread, or nothing is saved until quit
+            try:
+                self.save()
+            except Exception as e:
+                print(f"Error: {str(e)} occurred while autosaving data.")
+
+    def stop(self):
+        self.stopped.set()
+        self.changed.set()
+        self.join()
@@ -1,3 +1,4 @@
+import copy
 from validation import *
 from helpers import *
 from models import UserData, Item
@@ -24,17 +25,17 @@ def add_item(data, item):
     if not type(item) == Item:
         raise ValueError("Item is not valid")
 
-    data.items.append(item)
+    data.add_item(item)
 
 
 def delete_item(data, item_desc):
     """
     Parameters:
-        data (dict): The data to delete an item from.
+        data (UserData): The data to delete an item from.
         item_desc (str): The description of the item to delete.
 
     Returns:
-        dict: The data after deleting the item.
+        UserData: The data after deleting the item.
 
     Raises:
         ValueError: if data is not valid
@@ -42,27 +43,25 @@ def delete_item(data, item_desc):
         ValueError: if item_desc is not in data
     """
 
-    if not is_valid_data(data):
+    if not is_valid_user_data(data):
         raise ValueError("Data is not valid")
     if not is_valid_description(item_desc):
         raise ValueError("item_desc is not valid")
-    if item_desc not in [item["description"] for item in data["items"]]:
+    if data.get_item(item_desc) is None:
         raise ValueError("item_desc is not in data")
 
-    for item in data["items"]:
-        if item["description"] == item_desc:
-            data["items"].remove(item)
-            return data
+    data.remove_item(item_desc)
+    return data
 
 
 def toggle_item_active(data, item_desc):
     """
     Parameters:
-        data (dict): The data to toggle the active status of an item in.
-        item_desc (str): The id of the item to toggle the active status of.
+        data (UserData): The data to toggle the active status of an item in.
+        item_desc (str): The description of the item to toggle the active status of.
 
     Returns:
-        dict: The data after toggling the active status of the item.
+        UserData: The data after toggling the active status of the item.
 
     Raises:
         ValueError: if data is not valid
@@ -70,29 +69,28 @@ def toggle_item_active(data, item_desc):
         ValueError: if item_desc is not in data
     """
 
-    if not is_valid_data(data):
+    if not is_valid_user_data(data):
         raise ValueError("Data is not valid")
     if not is_valid_description(item_desc):
         raise ValueError("item_desc is not valid")
-    if item_desc not in [item["description"] for item in data["items"]]:
+    item = data.get_item(item_desc)
+    if item is None:
         raise ValueError("item_desc is not in data")
 
-    for item in data["items"]:
-        if item["description"] == item_desc:
-            item["active"] = not item["active"]
-            return data
+    data.set_item_attribute(item_desc, "active", not item.active)
+    return data
 
 
 def edit_item_attribute(data, item_desc, attribute, new_value):
     """
     Parameters:
-        data (dict): The data to edit an item in.
+        data (UserData): The data to edit an item in.
         item_desc (str): The description of the item to edit.
         attribute (str): The attribute to edit.
         new_value (str): The new value for the attribute.
 
     Returns:
-        dict: The data after editing the item.
+        UserData: The data after editing the item.
 
     Raises:
         ValueError: if data is not valid
@@ -102,7 +100,7 @@ def edit_item_attribute(data, item_desc, attribute, new_value):
         ValueError: if item_desc is not in data
     """
 
-    if not is_valid_data(data):
+    if not is_valid_user_data(data):
         raise ValueError("data is not valid")
     if not is_valid_description(item_desc):
         raise ValueError("item_desc is not valid")
@@ -110,14 +108,211 @@ def edit_item_attribute(data, item_desc, attribute, new_value):
         raise ValueError("attribute is not valid")
     if not is_valid_attribute_value(attribute, new_value):
         raise ValueError("new_value is not valid")
-    compat = get_compatibility_dict(get_item(item_desc, data))
-    del compat[attribute]
-    compat[attribute] = new_value
-    if not item_attribute_values_compatible(**compat):
-        raise ValueError("new_value is not compatabile with attribute")
-    if item_desc not in [item["description"] for item in data["items"]]:
+    item = data.get_item(item_desc)
+    if item is None:
         raise ValueError("item_desc is not in data")
+    if not attribute_value_compatible(item, attribute, new_value):
+        raise ValueError("new_value is not compatabile with attribute")
+
+    data.set_item_attribute(item_desc, attribute, new_value)
+    return data
+
+
+# Queues mutations and applies them together. Nothing touches the data until
+# commit, which replays the operations on copies of the items they affect,
+# validates each of those items once, and only then applies the net changes,
+# so either every operation takes effect or none does.
+#
+#     batch = Batch(data)
+#     for item in expired_goals:
+#         batch.delete_item(item.description)
+#     batch.commit(save_data)
+class Batch:
+    # The attributes an edit may change, by item type
+    ATTRIBUTES = {
+        "goal": {"description", "active", "start_date", "deadline", "gschedule"},
+        "routine": {"description", "active", "frequency", "rschedule"},
+    }
+
+    def __init__(self, data):
+        if not is_valid_user_data(data):
+            raise ValueError("Data is not valid")
+
+        self.data = data
+        self.operations = []
+
+    def add_item(self, item):
+        if not type(item) == Item:
+            raise ValueError("Item is not valid")
+        self.operations.append(("add", item))
+
+    def delete_item(self, item_desc):
+        if not is_valid_description(item_desc):
+            raise ValueError("item_desc is not valid")
+        self.operations.append(("delete", item_desc))
+
+    def toggle_item_active(self, item_desc):
+        if not is_valid_description(item_desc):
+            raise ValueError("item_desc is not valid")
+        self.operations.append(("toggle", item_desc))
+
+    def edit_item_attribute(self, item_desc, attribute, new_value):
+        if not is_valid_description(item_desc):
+            raise ValueError("item_desc is not valid")
+        if not is_valid_attribute_key(attribute):
+            raise ValueError("attribute is not valid")
+        if not is_valid_attribute_value(attribute, new_value):
+            raise ValueError("new_value is not valid")
+        self.operations.append(("edit", item_desc, attribute, new_value))
+
+    def commit(self, save=None):
+        """
+        Applies the queued operations to the data.
+
+        Parameters:
+            save (function): Called once with the data after applying, to
+                persist the changes, if given.
+
+        Returns:
+            UserData: The data after applying the operations.
+
+        Raises:
+            ValueError: if any operation is not valid, in which case the data
+                is left unchanged
+        """
+
+        data = self.data
+        with data.lock:
+            originals, staged = self.stage()
+            renames = self.order_renames(originals, staged)
+
+            # Deletions first and additions last free up descriptions before
+            # anything takes them
+            for key, item in staged.items():
+                if key in originals and item is None:
+                    data.remove_item(key)
+            for key, item in staged.items():
+                if key in originals and item is not None:
+                    before = originals[key].to_dict()
+                    for attribute, value in item.to_dict().items():
+                        if attribute == "description":
+                            continue
+                        if before.get(attribute) != value:
+                            data.set_item_attribute(key, attribute, value)
+            for old, new in renames:
+                data.set_item_attribute(old, "description", new)
+            for key, item in staged.items():
+                if key not in originals and item is not None:
+                    data.add_item(item)
+
+            self.operations = []
+
+        if save is not None:
+            save(data)
+        return data
+
+    # Internal helpers
+
+    def stage(self):
+        # Items are keyed by their description before the batch, or by
+        # position for items the batch adds. A staged value of None means
+        # the item is deleted. Added items were validated when constructed,
+        # so they are only copied and validated again if the batch edits them
+        originals, staged, names, unedited = {}, {}, {}, set()
+
+        def find(description):
+            if description in names:
+                return names[description]
+            if description in originals:
+                # Renamed or deleted earlier in the batch
+                return None
+            item = self.data.get_item(description)
+            if item is None:
+                return None
+            # Schedule setters replace their columns rather than changing
+            # them in place, so a shallow copy is safe to edit
+            originals[description] = item
+            staged[description] = copy.copy(item)
+            names[description] = description
+            return description
+
+        for i, operation in enumerate(self.operations):
+            op, description = operation[0], operation[1]
+            if op == "add":
+                description = operation[1].description
+                if find(description) is not None:
+                    raise ValueError(f"Operation {i}: duplicate description")
+                staged[i] = operation[1]
+                names[description] = i
+                unedited.add(i)
+                continue
+
+            key = find(description)
+            if key is None:
+                raise ValueError(f"Operation {i}: item_desc is not in data")
+            if key in unedited:
+                staged[key] = copy.copy(staged[key])
+                unedited.discard(key)
+            item = staged[key]
+
+            if op == "delete":
+                staged[key] = None
+                del names[description]
+            elif op == "toggle":
+                item.active = not item.active
+            elif operation[2] not in self.ATTRIBUTES[item.type]:
+                raise ValueError(f"Operation {i}: attribute does not apply to item")
+            elif operation[2] == "description":
+                new = operation[3]
+                if new != description:
+                    if find(new) is not None:
+                        raise ValueError(f"Operation {i}: duplicate description")
+                    del names[description]
+                    names[new] = key
+                item.description = new
+            else:
+                setattr(item, operation[2], operation[3])
+
+        for key, item in staged.items():
+            if item is not None and key not in unedited:
+                try:
+                    item.validate()
+                except ValueError as e:
+                    raise ValueError(f"{item.description}: {e}") from e
+
+        return originals, staged
+
+    def order_renames(self, originals, staged):
+        # A rename can only be applied once no other item holds the new
+        # description, so renames are ordered, and a cycle of renames is
+        # broken by moving one item to a temporary description first
+        pending = {
+            key: item.description
+            for key, item in staged.items()
+            if key in originals and item is not None and item.description != key
+        }
+        taken = set(self.data.index) | {
+            item.description for item in staged.values() if item is not None
+        }
+        held = set(pending)
+        renames = []
+        while pending:
+            ready = [(old, new) for old, new in pending.items() if new not in held]
+            if not ready:
+                old = next(iter(pending))
+                temporary = next(
+                    f"~{n}" for n in range(len(taken) + 1) if f"~{n}" not in taken
+                )
+                taken.add(temporary)
+                renames.append((old, temporary))
+                pending[temporary] = pending.pop(old)
+                held.discard(old)
+                held.add(temporary)
+                continue
+            for old, new in ready:
+                del pending[old]
+                held.discard(old)
+                held.add(new)
+                renames.append((old, new))
 
-    for item in data["items"]:
-        if item["description"] == item_desc:
-            item[attribute] = new_value
+        return renames
@@ -1,12 +1,129 @@
 import datetime
 import json
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+def date_converter(obj):
+    if isinstance(obj, datetime.date):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+# Writes to a temporary file and renames it into place, so a crash mid-write
+# leaves the previous file intact. The directory is synced as well so the
+# rename itself survives a crash
+def write_json_atomic(filename, obj):
+    tmp = filename + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as file:
+        json.dump(obj, file, default=date_converter)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, filename)
+    fsync_directory(filename)
+
+
+def fsync_directory(filename):
+    # Directories can only be opened for syncing where O_DIRECTORY exists
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Schedules are stored as parallel array("i") columns instead of lists of
+# two-element lists. These convert between the two formats.
+
+
+def gschedule_to_columns(gschedule):
+    days = array("i", [spec[0].toordinal() for spec in gschedule])
+    minutes = array("i", [spec[1] for spec in gschedule])
+    return days, minutes
+
+
+def columns_to_gschedule(days, minutes):
+    return [[datetime.date.fromordinal(d), m] for d, m in zip(days, minutes)]
+
+
+def rschedule_to_columns(rschedule):
+    slots = array("i", [spec[0] for spec in rschedule])
+    minutes = array("i", [spec[1] for spec in rschedule])
+    return slots, minutes
+
+
+def columns_to_rschedule(slots, minutes):
+    return [[s, m] for s, m in zip(slots, minutes)]
+
+
+# Routines are compiled into a bitmask of the day slots they fall on (7 bits
+# for week, 28 for month, 365 for year) plus a minutes-per-slot table, so
+# matching a date is a single bit test
+
+
+def day_slot(frequency, date_):
+    if frequency == "week":
+        return date_.weekday()
+    elif frequency == "month":
+        return date_.day
+    elif frequency == "year":
+        return date_.timetuple().tm_yday
+    return 0
+
+
+def slot_mask(slots):
+    mask = 0
+    for slot in slots:
+        if slot >= 0:
+            mask |= 1 << slot
+    return mask
+
+
+def slot_masks(frequency, start, end):
+    # Bitsets over the day offsets from start to end, one per day slot, so a
+    # routine's days in the range are the OR of the masks for its slots
+    masks = {}
+    for offset in range((end - start).days + 1):
+        slot = day_slot(frequency, start + datetime.timedelta(days=offset))
+        masks[slot] = masks.get(slot, 0) | 1 << offset
+    return masks
 
 
 # Data is a dictionary containing exactly 1 key: "items"
 class UserData:
     def __init__(self, data):
         self.validate_data(data)
-        self.items = data["items"]
+        # Items are stored in a description-keyed index, which keeps insertion
+        # order, so lookups, additions and deletions are all constant time
+        self.index = {item.description: item for item in data["items"]}
+        self.occurrences = OccurrenceIndex(data["items"])
+        # Attributes of items mutated since the data was last validated, by
+        # description. None stands for the whole item
+        self.dirty = {}
+        # Journal records for mutations not yet persisted, and the last
+        # record logged, persisted or not
+        self.pending = []
+        self.last_mutation = None
+        # Held by mutations and by saves running off the main thread
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict) or len(data) != 1 or "items" not in data:
+            raise ValueError("Invalid data")
+        return cls({"items": [Item.from_dict(item) for item in data["items"]]})
+
+    def to_dict(self):
+        return {"items": [item.to_dict() for item in self.index.values()]}
+
+    @property
+    def items(self):
+        return list(self.index.values())
 
     def validate_data(self, data):
         if not isinstance(data, dict) or len(data) != 1 or "items" not in data:
@@ -14,14 +131,214 @@ class UserData:
         for item in data["items"]:
             if not isinstance(item, Item):
                 raise ValueError("Invalid item")
+        descriptions = {item.description for item in data["items"]}
+        if len(descriptions) != len(data["items"]):
+            raise ValueError("Duplicate description")
+
+    # Items are fully validated when constructed, so only the attributes
+    # mutated since the last call need to be checked again
+
+    def is_valid(self):
+        for description, attributes in self.dirty.items():
+            item = self.index.get(description)
+            if item is None:
+                continue
+            try:
+                if None in attributes:
+                    item.validate()
+                else:
+                    for attribute in attributes:
+                        item.validate_attribute(attribute)
+            except ValueError:
+                return False
+        self.dirty.clear()
+        return True
+
+    # Index methods
+
+    def get_item(self, description):
+        return self.index.get(description)
+
+    def add_item(self, item):
+        with self.lock:
+            if not isinstance(item, Item):
+                raise ValueError("Invalid item")
+            if item.description in self.index:
+                raise ValueError("Duplicate description")
+            self.index[item.description] = item
+            self.occurrences.add(item)
+            self.dirty[item.description] = {None}
+            self.log_mutation({"op": "add", "item": item.to_dict()})
+
+    def remove_item(self, description):
+        with self.lock:
+            if description not in self.index:
+                raise ValueError("Item not found")
+            item = self.index.pop(description)
+            self.occurrences.remove(item)
+            self.dirty.pop(description, None)
+            self.log_mutation({"op": "delete", "description": description})
+            return item
+
+    def set_item_attribute(self, description, attribute, value):
+        with self.lock:
+            item = self.get_item(description)
+            if item is None:
+                raise ValueError("Item not found")
+
+            # A renamed item moves to the end of the index rather than paying
+            # for a rebuild to keep its position
+            if attribute == "description" and value != description:
+                if value in self.index:
+                    raise ValueError("Duplicate description")
+                del self.index[description]
+                self.index[value] = item
+
+            # Only attributes that decide which days an item falls on need
+            # reindexing
+            reindex = attribute in OccurrenceIndex.ATTRIBUTES
+            if reindex:
+                self.occurrences.remove(item)
+            setattr(item, attribute, value)
+            if reindex:
+                self.occurrences.add(item)
+            attributes = self.dirty.pop(description, set())
+            attributes.add(attribute)
+            self.dirty[item.description] = attributes
+            self.log_mutation(
+                {
+                    "op": "set",
+                    "description": description,
+                    "attribute": attribute,
+                    "value": value,
+                }
+            )
+
+    def log_mutation(self, record):
+        record["time"] = time.time()
+        self.pending.append(record)
+        self.last_mutation = record
 
     def write_data_to_file(self, filename):
-        with open(filename, "w") as file:
-            json.dump({"items": self.items}, file)
+        with self.lock:
+            snapshot = self.to_dict()
+        write_json_atomic(filename, snapshot)
+
+
+# Maps days to the items that fall on them. Goals are keyed by scheduled date
+# ordinal, routines by frequency and the day slot they match (see
+# date_in_rschedule)
+class OccurrenceIndex:
+    ATTRIBUTES = {"description", "type", "frequency", "rschedule", "gschedule"}
+
+    def __init__(self, items=()):
+        self.daily = {}
+        self.goals = {}
+        self.routines = {"week": {}, "month": {}, "year": {}}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item.type == "goal":
+            for day in item.gschedule_days:
+                self.goals.setdefault(day, {})[item.description] = item
+        elif item.frequency == "day":
+            self.daily[item.description] = item
+        else:
+            slots = self.routines[item.frequency]
+            for slot in item.rschedule_slots:
+                slots.setdefault(slot, {})[item.description] = item
+
+    def remove(self, item):
+        if item.type == "goal":
+            buckets, keys = self.goals, item.gschedule_days
+        elif item.frequency == "day":
+            self.daily.pop(item.description, None)
+            return
+        else:
+            buckets = self.routines[item.frequency]
+            keys = item.rschedule_slots
+
+        for key in keys:
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.pop(item.description, None)
+                if not bucket:
+                    del buckets[key]
+
+    def items_for_date(self, date_):
+        matches = dict(self.daily)
+        matches.update(self.goals.get(date_.toordinal(), {}))
+        matches.update(self.routines["week"].get(date_.weekday(), {}))
+        matches.update(self.routines["month"].get(date_.day, {}))
+        matches.update(self.routines["year"].get(date_.timetuple().tm_yday, {}))
+        return list(matches.values())
+
+    # Expands every bucket over the range at once instead of querying day by day
+
+    def items_for_range(self, start, end):
+        first, last = start.toordinal(), end.toordinal()
+        days = {}
+
+        def extend(ordinal, bucket):
+            days.setdefault(ordinal, {}).update(bucket)
+
+        if self.daily:
+            for ordinal in range(first, last + 1):
+                extend(ordinal, self.daily)
+
+        if len(self.goals) < last - first + 1:
+            for ordinal, bucket in self.goals.items():
+                if first <= ordinal <= last:
+                    extend(ordinal, bucket)
+        else:
+            for ordinal in range(first, last + 1):
+                bucket = self.goals.get(ordinal)
+                if bucket:
+                    extend(ordinal, bucket)
+
+        for slot, bucket in self.routines["week"].items():
+            for ordinal in range(first + (slot - start.weekday()) % 7, last + 1, 7):
+                extend(ordinal, bucket)
+
+        months = range(start.year * 12 + start.month - 1, end.year * 12 + end.month)
+        for slot, bucket in self.routines["month"].items():
+            if not 1 <= slot <= 28:
+                continue
+            for month in months:
+                ordinal = datetime.date(month // 12, month % 12 + 1, slot).toordinal()
+                if first <= ordinal <= last:
+                    extend(ordinal, bucket)
+
+        for slot, bucket in self.routines["year"].items():
+            if slot < 1:
+                continue
+            for year in range(start.year, end.year + 1):
+                ordinal = datetime.date(year, 1, 1).toordinal() + slot - 1
+                if first <= ordinal <= last:
+                    extend(ordinal, bucket)
+
+        return {
+            datetime.date.fromordinal(ordinal): list(days[ordinal].values())
+            for ordinal in sorted(days)
+        }
 
 
 class Item:
-    descriptions = set()  # To track all descriptions
+    __slots__ = (
+        "description",
+        "type",
+        "active",
+        "frequency",
+        "start_date",
+        "deadline",
+        "gschedule_days",
+        "gschedule_minutes",
+        "rschedule_slots",
+        "rschedule_minutes",
+        "rschedule_mask",
+        "rschedule_table",
+    )
 
     def __init__(
         self,
@@ -51,14 +368,144 @@ class Item:
             self.start_date = start_date
             self.deadline = deadline
 
-        self.descriptions.add(description)
+    @classmethod
+    def from_dict(cls, item):
+        if not isinstance(item, dict):
+            raise ValueError("Invalid item")
+        return cls(
+            item.get("description"),
+            item.get("type"),
+            item.get("active"),
+            rschedule=item.get("rschedule"),
+            frequency=item.get("frequency"),
+            gschedule=item.get("gschedule"),
+            start_date=item.get("start_date"),
+            deadline=item.get("deadline"),
+        )
+
+    def to_dict(self):
+        item = {"description": self.description, "type": self.type}
+        if self.type == "routine":
+            item["frequency"] = self.frequency
+            item["rschedule"] = self.rschedule
+        elif self.type == "goal":
+            item["start_date"] = self.start_date
+            item["deadline"] = self.deadline
+            item["gschedule"] = self.gschedule
+        item["active"] = self.active
+        return item
+
+    # Schedules read and write in the list-of-lists format but are stored as
+    # columns. The gschedule is kept sorted by date, so its bounds are its
+    # first and last entries and lookups can binary search
+
+    @property
+    def gschedule(self):
+        return columns_to_gschedule(self.gschedule_days, self.gschedule_minutes)
+
+    @gschedule.setter
+    def gschedule(self, gschedule):
+        gschedule = sorted(gschedule, key=lambda spec: spec[0])
+        self.gschedule_days, self.gschedule_minutes = gschedule_to_columns(gschedule)
+
+    @property
+    def gschedule_bounds(self):
+        days = self.gschedule_days
+        if not days:
+            return None
+        return datetime.date.fromordinal(days[0]), datetime.date.fromordinal(days[-1])
+
+    def scheduled_on(self, date_):
+        days, ordinal = self.gschedule_days, date_.toordinal()
+        i = bisect_left(days, ordinal)
+        return i < len(days) and days[i] == ordinal
+
+    def minutes_on(self, date_):
+        days, ordinal = self.gschedule_days, date_.toordinal()
+        lo, hi = bisect_left(days, ordinal), bisect_right(days, ordinal)
+        return sum(self.gschedule_minutes[lo:hi])
+
+    def gschedule_between(self, start, end):
+        # The days and minutes columns of the entries from start to end
+        days = self.gschedule_days
+        lo = bisect_left(days, start.toordinal())
+        hi = bisect_right(days, end.toordinal())
+        return days[lo:hi], self.gschedule_minutes[lo:hi]
+
+    @property
+    def rschedule(self):
+        return columns_to_rschedule(self.rschedule_slots, self.rschedule_minutes)
+
+    @rschedule.setter
+    def rschedule(self, rschedule):
+        self.rschedule_slots, self.rschedule_minutes = rschedule_to_columns(rschedule)
+        slots = [slot for slot in self.rschedule_slots if slot >= 0]
+        self.rschedule_mask = slot_mask(slots)
+        self.rschedule_table = array("i", [0]) * (max(slots) + 1 if slots else 0)
+        for slot, minutes in zip(self.rschedule_slots, self.rschedule_minutes):
+            if slot >= 0:
+                self.rschedule_table[slot] += minutes
+
+    def occurs_on(self, date_):
+        if self.type == "goal":
+            return self.scheduled_on(date_)
+        elif self.frequency == "day":
+            return True
+        return self.rschedule_mask >> day_slot(self.frequency, date_) & 1 == 1
+
+    def routine_minutes_on(self, date_):
+        slot = day_slot(self.frequency, date_)
+        return self.rschedule_table[slot] if slot < len(self.rschedule_table) else 0
+
+    def occurrence_mask(self, masks):
+        # masks come from slot_masks for this routine's frequency and a range
+        if self.frequency == "day":
+            return masks.get(0, 0)
+        mask, slots = 0, self.rschedule_mask
+        while slots:
+            slot = slots.bit_length() - 1
+            mask |= masks.get(slot, 0)
+            slots &= ~(1 << slot)
+        return mask
 
     # Validation methods
 
-    @classmethod
-    def validate_description(cls, description):
-        if not 1 <= len(description) <= 15 or description in cls.descriptions:
-            raise ValueError("Invalid or duplicate description.")
+    def validate(self):
+        self.validate_description(self.description)
+        self.validate_type(self.type)
+        self.validate_active(self.active)
+        if self.type == "routine":
+            self.validate_routine(self.frequency, self.rschedule)
+        elif self.type == "goal":
+            self.validate_goal(self.gschedule, self.start_date, self.deadline)
+
+    def validate_attribute(self, attribute):
+        # Checks only the invariants an attribute takes part in. A goal's
+        # dates are checked against the schedule's bounds, so editing them
+        # doesn't cost time proportional to the schedule
+        if attribute == "description":
+            self.validate_description(self.description)
+        elif attribute == "active":
+            self.validate_active(self.active)
+        elif attribute in {"start_date", "deadline"} and self.type == "goal":
+            self.validate_date(self.start_date)
+            self.validate_date(self.deadline)
+            bounds = self.gschedule_bounds
+            if (
+                bounds
+                and not self.start_date <= bounds[0] <= bounds[1] <= self.deadline
+            ):
+                raise ValueError("Invalid gschedule")
+        elif attribute in {"frequency", "rschedule"} and self.type == "routine":
+            self.validate_routine(self.frequency, self.rschedule)
+        else:
+            self.validate()
+
+    # Uniqueness of descriptions is enforced by UserData's index
+
+    def validate_description(self, description):
+        if not isinstance(description, str) or not 1 <= len(description) <= 15:
+            raise ValueError("Invalid description.")
 
     def validate_type(self, item_type):
         if item_type not in {"routine", "goal"}:
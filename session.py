@@ -0,0 +1,59 @@
+import threading
+import time
+from journal import Autosaver
+
+
+# Owns the user's data for the lifetime of the program. Nothing is read until
+# the data is first needed, or until ensure_loaded is called (the GUI calls
+# it on its background worker), so importing the CLI or the GUI does no file
+# I/O.
+class DataSession:
+    def __init__(self, load, save, autosave_delay=1.0):
+        self.load = load
+        self.save = save
+        self.autosave_delay = autosave_delay
+        self.autosaver = None
+        self.loaded = False
+        self.load_seconds = None
+        self.error = None
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def data(self):
+        self.ensure_loaded()
+        if self.error is not None:
+            raise self.error
+        return self._data
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    self._load()
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            self._data = self.load()
+        except ValueError as e:
+            self.error = e
+        self.load_seconds = time.perf_counter() - start
+        self.loaded = True
+
+    # Autosave
+
+    def start_autosave(self):
+        if self.autosaver is None:
+            save = lambda: self.save(self.data)
+            self.autosaver = Autosaver(save, self.autosave_delay)
+            self.autosaver.start()
+
+    def notify(self):
+        if self.autosaver is not None:
+            self.autosaver.notify()
+
+    def stop_autosave(self):
+        if self.autosaver is not None:
+            self.autosaver.stop()
+            self.autosaver = None
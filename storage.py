@@ -0,0 +1,352 @@
+import json
+import sqlite3
+from contextlib import closing
+from datetime import date
+from models import UserData, Item
+from journal import *
+
+
+# Storage backends load a UserData and persist its pending mutations. Both
+# only write what changed since the last save, and save returns the journal
+# records it persisted.
+
+
+def open_storage(datafile):
+    """
+    Parameters:
+        datafile (str): The path of the data file.
+
+    Returns:
+        JsonStorage or SqliteStorage: The backend matching the file extension.
+    """
+
+    if datafile.endswith((".db", ".sqlite", ".sqlite3")):
+        return SqliteStorage(datafile)
+    return JsonStorage(datafile)
+
+
+# Only these fields hold dates, so decoding converts them and nothing else
+# instead of trying every string in the file
+
+
+def decode_item(item):
+    """
+    Converts the date fields of an item decoded from JSON, in place.
+
+    Parameters:
+        item (dict): The item as decoded from JSON.
+
+    Returns:
+        dict: The item, with datetime.date values.
+
+    Raises:
+        ValueError: if a date field is not valid
+    """
+
+    if not isinstance(item, dict) or item.get("type") != "goal":
+        return item
+
+    try:
+        item["start_date"] = date.fromisoformat(item["start_date"])
+        item["deadline"] = date.fromisoformat(item["deadline"])
+        item["gschedule"] = [
+            [date.fromisoformat(spec[0]), spec[1]] for spec in item["gschedule"]
+        ]
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError("Invalid item") from e
+
+    return item
+
+
+def decode_record(record):
+    """
+    Converts the date fields of a journal record decoded from JSON, in place.
+
+    Parameters:
+        record (dict): The record as decoded from JSON.
+
+    Returns:
+        dict: The record, with datetime.date values.
+
+    Raises:
+        ValueError: if a date field is not valid
+    """
+
+    if record.get("op") == "add":
+        decode_item(record["item"])
+    elif record.get("op") == "set":
+        attribute, value = record["attribute"], record["value"]
+        if attribute in {"start_date", "deadline"}:
+            record["value"] = date.fromisoformat(value)
+        elif attribute == "gschedule":
+            record["value"] = [[date.fromisoformat(s[0]), s[1]] for s in value]
+
+    return record
+
+
+def decode_data(raw):
+    """
+    Builds UserData straight from a snapshot decoded from JSON. Constructing
+    each Item validates it, so this is the only full validation pass.
+
+    Parameters:
+        raw (dict): The snapshot as decoded from JSON.
+
+    Returns:
+        UserData: The decoded data.
+
+    Raises:
+        ValueError: if the data is not valid
+    """
+
+    if not isinstance(raw, dict) or len(raw) != 1 or "items" not in raw:
+        raise ValueError("Data is not valid")
+    if not isinstance(raw["items"], list):
+        raise ValueError("Data is not valid")
+
+    return UserData(
+        {"items": [Item.from_dict(decode_item(item)) for item in raw["items"]]}
+    )
+
+
+# A JSON snapshot plus an append-only journal of mutations (see journal.py)
+class JsonStorage:
+    def __init__(self, datafile):
+        self.datafile = datafile
+
+    def load(self):
+        try:
+            with open(self.datafile, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            print("Error: no data file")
+            return None
+
+        data = decode_data(raw)
+        for record in read_records(self.datafile):
+            apply_record(data, decode_record(record))
+        data.pending.clear()
+
+        return data
+
+    def save(self, data, compact=False):
+        compact = compact or needs_compaction(self.datafile)
+        with data.lock:
+            records, data.pending = data.pending, []
+            snapshot = data.to_dict() if compact else None
+
+        try:
+            if compact:
+                write_snapshot(self.datafile, snapshot)
+            else:
+                append_records(self.datafile, records)
+        except Exception as e:
+            # Records that weren't written stay pending, whatever went wrong
+            with data.lock:
+                data.pending[:0] = records
+            if not isinstance(e, OSError):
+                raise
+            print(
+                f"Error: {str(e)} occurred while saving data to file {self.datafile}."
+            )
+            return []
+
+        return records
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    description TEXT NOT NULL UNIQUE,
+    type TEXT NOT NULL,
+    active INTEGER NOT NULL,
+    frequency TEXT,
+    start_date TEXT,
+    deadline TEXT
+);
+CREATE TABLE IF NOT EXISTS goal_schedule (
+    id INTEGER PRIMARY KEY,
+    item_id INTEGER NOT NULL REFERENCES items (id) ON DELETE CASCADE,
+    date TEXT NOT NULL,
+    minutes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS routine_specs (
+    id INTEGER PRIMARY KEY,
+    item_id INTEGER NOT NULL REFERENCES items (id) ON DELETE CASCADE,
+    slot INTEGER NOT NULL,
+    minutes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS goal_schedule_item ON goal_schedule (item_id);
+CREATE INDEX IF NOT EXISTS routine_specs_item ON routine_specs (item_id);
+DROP INDEX IF EXISTS goal_schedule_date;
+DROP INDEX IF EXISTS routine_specs_slot;
+"""
+
+ITEM_COLUMNS = {"description", "type", "active", "frequency", "start_date", "deadline"}
+
+
+# Items, goal schedule entries and routine specs in sqlite3 tables. Loading
+# reads every row, and queries are answered by the loaded data's
+# OccurrenceIndex; saves apply the pending journal records as statements in
+# one transaction, so only what changed is written. Schedule rows are only
+# indexed by item, for the statements saves run.
+class SqliteStorage:
+    def __init__(self, datafile):
+        self.datafile = datafile
+
+    def connect(self):
+        conn = sqlite3.connect(self.datafile)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def load(self):
+        with closing(self.connect()) as conn:
+            raw = {"items": self.select_items(conn)}
+
+        # Constructing each Item validates it, so this is the only full pass
+        return UserData.from_dict(raw)
+
+    def save(self, data, compact=False):
+        with data.lock:
+            records, data.pending = data.pending, []
+            snapshot = data.to_dict() if compact else None
+
+        try:
+            with closing(self.connect()) as conn, conn:
+                if compact:
+                    conn.execute("DELETE FROM items")
+                    for item in snapshot["items"]:
+                        self.insert_item(conn, item)
+                else:
+                    for record in records:
+                        self.apply_record(conn, record)
+        except Exception as e:
+            # Records that weren't written stay pending, whatever went wrong
+            with data.lock:
+                data.pending[:0] = records
+            if not isinstance(e, (sqlite3.Error, OSError)):
+                raise
+            print(
+                f"Error: {str(e)} occurred while saving data to file {self.datafile}."
+            )
+            return []
+
+        return records
+
+    # Internal helpers
+
+    def select_items(self, conn):
+        # Items come back in id order, which is the order UserData keeps them
+        # in (see rename_item)
+        rows = conn.execute(
+            "SELECT id, description, type, active, frequency, start_date, deadline "
+            "FROM items ORDER BY id"
+        ).fetchall()
+        gschedules = {row[0]: [] for row in rows}
+        rschedules = {row[0]: [] for row in rows}
+        for item_id, date_, minutes in conn.execute(
+            "SELECT item_id, date, minutes FROM goal_schedule ORDER BY id"
+        ):
+            gschedules[item_id].append([date.fromisoformat(date_), minutes])
+        for item_id, slot, minutes in conn.execute(
+            "SELECT item_id, slot, minutes FROM routine_specs ORDER BY id"
+        ):
+            rschedules[item_id].append([slot, minutes])
+
+        items = []
+        for id_, description, type_, active, frequency, start, deadline in rows:
+            item = {"description": description, "type": type_}
+            if type_ == "routine":
+                item["frequency"] = frequency
+                item["rschedule"] = rschedules[id_]
+            elif type_ == "goal":
+                item["start_date"] = date.fromisoformat(start)
+                item["deadline"] = date.fromisoformat(deadline)
+                item["gschedule"] = gschedules[id_]
+            item["active"] = bool(active)
+            items.append(item)
+
+        return items
+
+    def insert_item(self, conn, item):
+        cursor = conn.execute(
+            "INSERT INTO items (description, type, active, frequency, start_date, "
+            "deadline) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                item["description"],
+                item["type"],
+                item["active"],
+                item.get("frequency"),
+                self.to_column(item.get("start_date")),
+                self.to_column(item.get("deadline")),
+            ),
+        )
+        self.insert_schedule(conn, cursor.lastrowid, item["type"], item)
+
+    def insert_schedule(self, conn, item_id, type_, item):
+        if type_ == "goal":
+            conn.executemany(
+                "INSERT INTO goal_schedule (item_id, date, minutes) VALUES (?, ?, ?)",
+                [(item_id, spec[0].isoformat(), spec[1]) for spec in item["gschedule"]],
+            )
+        elif type_ == "routine":
+            conn.executemany(
+                "INSERT INTO routine_specs (item_id, slot, minutes) VALUES (?, ?, ?)",
+                [(item_id, spec[0], spec[1]) for spec in item["rschedule"]],
+            )
+
+    def apply_record(self, conn, record):
+        op = record["op"]
+        if op == "add":
+            self.insert_item(conn, record["item"])
+        elif op == "delete":
+            conn.execute(
+                "DELETE FROM items WHERE description = ?", (record["description"],)
+            )
+        elif op == "set" and record["attribute"] == "description":
+            self.rename_item(conn, record["description"], record["value"])
+        elif op == "set" and record["attribute"] in ITEM_COLUMNS:
+            conn.execute(
+                f"UPDATE items SET {record['attribute']} = ? WHERE description = ?",
+                (self.to_column(record["value"]), record["description"]),
+            )
+        elif op == "set" and record["attribute"] in {"gschedule", "rschedule"}:
+            item_id, type_ = self.select_row(conn, record["description"])
+            table = "goal_schedule" if type_ == "goal" else "routine_specs"
+            conn.execute(f"DELETE FROM {table} WHERE item_id = ?", (item_id,))
+            self.insert_schedule(
+                conn, item_id, type_, {record["attribute"]: record["value"]}
+            )
+        else:
+            raise ValueError("Invalid journal record")
+
+    def rename_item(self, conn, old, new):
+        # UserData moves a renamed item to the end, so the row moves to a new
+        # id after every other item and takes its schedule rows with it
+        if old == new:
+            return
+        old_id, _ = self.select_row(conn, old)
+        new_id = conn.execute("SELECT MAX(id) + 1 FROM items").fetchone()[0]
+        conn.execute(
+            "INSERT INTO items (id, description, type, active, frequency, "
+            "start_date, deadline) SELECT ?, ?, type, active, frequency, "
+            "start_date, deadline FROM items WHERE id = ?",
+            (new_id, new, old_id),
+        )
+        for table in ("goal_schedule", "routine_specs"):
+            conn.execute(
+                f"UPDATE {table} SET item_id = ? WHERE item_id = ?", (new_id, old_id)
+            )
+        conn.execute("DELETE FROM items WHERE id = ?", (old_id,))
+
+    def select_row(self, conn, description):
+        row = conn.execute(
+            "SELECT id, type FROM items WHERE description = ?", (description,)
+        ).fetchone()
+        if row is None:
+            raise ValueError("Invalid journal record")
+        return row
+
+    def to_column(self, value):
+        return value.isoformat() if isinstance(value, date) else value
@@ -1,58 +1,91 @@
+import os
 import sys
-import json
+import threading
 from datetime import date, timedelta
 from validation import *
 from user_input import *
 from helpers import *
 from managers import *
+from models import Item
+from journal import *
+from storage import *
+from session import DataSession
+from history import History
+from completions import CompletionLog, planned_total
+import instrumentation
+from importer import import_items
 
 
 # Display
 
 
-def display_items(items):
+def format_items(items):
     """
-    Displays the items in a readable format.
-
     Parameters:
-        items (list): A list of item dictionaries.
+        items (list): A list of items.
 
-    Raises:
-        ValueError: if items is not valid
+    Returns:
+        str: The items in a readable format.
     """
 
-    if not is_valid_items(items):
-        raise ValueError("Items is not valid")
-
     if not items:
-        print(
-            """
+        return """
         No items in the list.
         """
-        )
-        return
 
-    print("============ Items ============")
+    lines = ["============ Items ============"]
     for i, item in enumerate(items, start=1):
-        print(
-            f"{i}. {item['description']} ({item['type']}) ({'active' if item['active'] else 'inactive'})"
+        lines.append(
+            f"{i}. {item.description} ({item.type}) ({'active' if item.active else 'inactive'})"
         )
 
-        if item["type"] == "goal":
-            print(f"   Start Date: {item['start_date']}")
-            print(f"   Deadline: {item['deadline']}")
-            print(f"   Schedule: {item['gschedule']}")
-        elif item["type"] == "routine":
-            print(f"   Frequency: {item['frequency']}")
-            print(f"   Schedule: {item['rschedule']}")
+        if item.type == "goal":
+            lines.append(f"   Start Date: {item.start_date}")
+            lines.append(f"   Deadline: {item.deadline}")
+            lines.append(f"   Schedule: {item.gschedule}")
+        elif item.type == "routine":
+            lines.append(f"   Frequency: {item.frequency}")
+            lines.append(f"   Schedule: {item.rschedule}")
+
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def format_day_page(items, date_):
+    """
+    Parameters:
+        items (list): The items falling on the date.
+        date_ (datetime.date): The date of the page.
+
+    Returns:
+        str: The day view page for the date.
+    """
+
+    return f"=== {date_.weekday()}, {date_.isoformat()} ===\n{format_items(items)}"
+
+
+def display_items(items):
+    """
+    Displays the items in a readable format.
+
+    Parameters:
+        items (list): A list of items.
+
+    Raises:
+        ValueError: if items is not valid
+    """
+
+    if not isinstance(items, list) or not all(isinstance(i, Item) for i in items):
+        raise ValueError("Items is not valid")
 
-        print()
+    print(format_items(items))
 
 
 def display_items_for_date(data, date_):
     """
     Parameters:
-        data (dict): The data to display.
+        data (UserData): The data to display.
         date (datetime.date): The date to display.
 
     Raises:
@@ -60,46 +93,199 @@ def display_items_for_date(data, date_):
         ValueError: if date is not valid
     """
 
-    if not is_valid_data(data):
+    if not is_valid_user_data(data):
         raise ValueError("Data is not valid")
     if not is_valid_date(date_):
         raise ValueError("Date is not valid")
 
-    items = get_items_for_date(data, date_)
-    year = int(date_.isoformat().split("-")[0])
-    month = int(date_.isoformat().split("-")[1])
-    day = int(date_.isoformat().split("-")[2])
-    weekday = date(year, month, day).weekday()
-    print(f"=== {weekday}, {date_.isoformat()} ===")
-    display_items(items)
+    print(format_day_page(get_items_for_date(data, date_), date_))
+
+
+# Rendered day view pages for the days around the one on screen. A background
+# thread renders the window around each page shown, a range query at a time,
+# so paging through days only prints pages that are already rendered. The
+# data can't change while the day view is open, so pages never go stale.
+class DayPages:
+    RADIUS = 14
+
+    def __init__(self, data, radius=RADIUS):
+        self.data = data
+        self.radius = radius
+        self.pages = {}
+        self.centre = None
+        self.lock = threading.Lock()
+        self.moved = threading.Event()
+        self.stopped = False
+        self.filler = threading.Thread(target=self.fill, daemon=True)
+        self.filler.start()
+
+    def get(self, date_):
+        with self.lock:
+            page = self.pages.get(date_)
+        if page is None:
+            with self.data.lock:
+                page = format_day_page(get_items_for_date(self.data, date_), date_)
+            with self.lock:
+                self.pages[date_] = page
+
+        self.centre = date_
+        self.moved.set()
+        return page
+
+    def fill(self):
+        while True:
+            self.moved.wait()
+            self.moved.clear()
+            if self.stopped:
+                return
+
+            centre = self.centre
+            window = [
+                centre + timedelta(days=i) for i in range(-self.radius, self.radius + 1)
+            ]
+            with self.lock:
+                missing = [d for d in window if d not in self.pages]
+                # Keep twice the window so paging back and forth stays cached
+                for d in list(self.pages):
+                    if abs((d - centre).days) > 2 * self.radius:
+                        del self.pages[d]
+            if not missing:
+                continue
+
+            with self.data.lock:
+                items = get_items_for_range(self.data, missing[0], missing[-1])
+            pages = {d: format_day_page(items.get(d, []), d) for d in missing}
+            with self.lock:
+                for d, page in pages.items():
+                    self.pages.setdefault(d, page)
+
+    def stop(self):
+        self.stopped = True
+        self.moved.set()
+        self.filler.join()
 
 
 def enter_day_view(data):
     """
     Parameters:
-        data (dict): The data to enter day view with.
+        data (UserData): The data to enter day view with.
 
     Raises:
         ValueError: if data is not valid
     """
 
-    if not is_valid_data(data):
+    if not is_valid_user_data(data):
         raise ValueError("Data is not valid")
 
+    pages = DayPages(data)
     date_ = date.today()
-    while True:
-        display_items_for_date(data, date_)
-        choice = input(
-            "Enter b for previous day, n for next day, or r to return to menu: "
+    try:
+        while True:
+            print(pages.get(date_))
+            choice = input(
+                "Enter b for previous day, n for next day, or r to return to menu: "
+            )
+            if choice == "b":
+                date_ -= timedelta(days=1)
+            elif choice == "n":
+                date_ += timedelta(days=1)
+            elif choice == "r":
+                return
+            else:
+                print("Invalid input")
+    finally:
+        pages.stop()
+
+
+def record_completion(data):
+    """
+    Prompts for an item and the minutes spent on it today and queues them to
+    be recorded by the next save, which the autosaver is told to run.
+
+    Parameters:
+        data (UserData): The data to record a completion for.
+
+    Raises:
+        ValueError: if data is not valid
+    """
+
+    if not is_valid_user_data(data):
+        raise ValueError("Data is not valid")
+
+    item_desc = prompt_for_existing_item_desc(data)
+    if item_desc is None:
+        print("Completion not recorded.")
+        return
+    duration = prompt_for_value(
+        "Enter minutes spent: ", is_valid_duration_string, "Invalid duration."
+    )
+    if duration is None:
+        print("Completion not recorded.")
+        return
+
+    today = date.today()
+    with data.lock:
+        after = data.last_mutation
+    completions.queue(item_desc, today, int(duration), after)
+    session.notify()
+    planned = planned_total(data.get_item(item_desc), today, today)
+    print(f"Recorded {int(duration)} minutes. Today's plan: {planned} minutes.")
+
+
+def import_from_file(data):
+    """
+    Prompts for a file and imports its items, saving them in one go.
+
+    Parameters:
+        data (UserData): The data to import into.
+    """
+
+    filename = input("Enter file to import: ")
+    skip = prompt_for_value(
+        "Skip records that can't be imported? (y/n): ", is_valid_yes_no, "Invalid input"
+    )
+    if skip is None:
+        print("Nothing imported.")
+        return
+
+    try:
+        imported, errors = import_items(data, filename, save_data, skip == "y")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}. Nothing imported.")
+        return
+
+    for error in errors:
+        print(f"Skipped: {error}")
+    print(f"Imported {imported} items.")
+
+
+def display_timing_stats():
+    """
+    Displays the call counts and times collected by instrumentation.
+    """
+
+    stats = instrumentation.report()
+    if not stats:
+        print("No timing stats. Enter ti to start timing.")
+        return
+
+    print("============ Timing ============")
+    for name, stat in stats.items():
+        print(
+            f"{name}: {stat['count']} calls, {stat['total_seconds'] * 1000:.1f} ms "
+            f"total, {stat['mean_seconds'] * 1e6:.1f} us mean"
         )
-        if choice == "b":
-            date_ -= timedelta(days=1)
-        elif choice == "n":
-            date_ += timedelta(days=1)
-        elif choice == "r":
-            return
-        else:
-            print("Invalid input")
+        buckets = [f"<={b}: {n}" for b, n in stat["histogram"].items() if n]
+        print(f"   {', '.join(buckets)}")
+
+
+def toggle_timing():
+    if instrumentation.enabled():
+        instrumentation.disable()
+        print("Timing stopped.")
+    else:
+        instrumentation.enable(TIMED_FUNCTIONS)
+        print("Timing started.")
 
 
 def display_controls():
@@ -112,6 +298,10 @@ def display_controls():
     ed - edit item attribute
     di - display all items
     e - enter day view
+    c - record completion
+    im - import items from a .csv or .ics file
+    ti - toggle timing
+    st - display timing stats
     q - quit
 
     """
@@ -121,46 +311,45 @@ def display_controls():
 # Control flow
 
 
-def save_data(data):
-    def date_converter(obj):
-        if isinstance(obj, date):
-            return obj.isoformat()
-        raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
-
-    try:
-        with open(DATAFILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, default=date_converter)
-    except (FileNotFoundError, PermissionError, IsADirectoryError, OSError) as e:
-        print(f"Error: {str(e)} occurred while saving data to file {DATAFILE}.")
-
-
-def process_value(value):
-    if isinstance(value, str):
-        try:
-            return date.fromisoformat(value)
-        except ValueError:
-            return value  # not a date
-    elif isinstance(value, list):
-        return [process_value(item) for item in value]
-    return value
+def save_data(data, compact=False):
+    """
+    Persists the data's unsaved mutations to the configured storage, writing
+    everything only when asked to or when the storage needs compacting, and
+    records them in the history. Safe to call from a background thread.
 
+    Parameters:
+        data (UserData): The data to save.
+        compact (bool): Whether to rewrite the stored data in full.
+    """
 
-def iso_to_date(dct):
-    for key, value in dct.items():
-        dct[key] = process_value(value)
-    return dct
+    # Saves from the autosaver and the main thread must not interleave
+    with save_lock:
+        records = storage.save(data, compact)
+        with data.lock:
+            unsaved = list(data.pending)
+        completions.apply(records, unsaved)
+        history.record(records)
 
 
 def retrieve_data():
-    try:
-        with open(DATAFILE, "r", encoding="utf-8") as f:
-            return json.load(f, object_hook=iso_to_date)
-    except FileNotFoundError:
-        print("Error: no data file")
+    """
+    Returns:
+        UserData: The data loaded from the configured storage or
+        None.
+    """
+
+    data = storage.load()
+    if data is not None:
+        history.start(data)
+    return data
 
 
 def quit_program(data):
+    session.stop_autosave()
     save_data(data)
+    if instrumentation.report():
+        instrumentation.dump(TIMING_FILE)
+        print(f"Timing stats written to {TIMING_FILE}.")
     print("Goodbye!")
     sys.exit()
 
@@ -168,11 +357,27 @@ def quit_program(data):
 # Main
 
 
-DATAFILE = "data.json"
-data = retrieve_data()
+# A data file ending in .db, .sqlite or .sqlite3 is kept in SQLite instead of
+# as JSON (see open_storage)
+DATAFILE = os.environ.get("TODO_DATAFILE", "data.json")
+AUTOSAVE_DELAY = 1.0
+storage = open_storage(DATAFILE)
+history = History(DATAFILE + ".history")
+completions = CompletionLog(DATAFILE + ".completions")
+save_lock = threading.Lock()
+TIMING_FILE = "timing.json"
+TIMED_FUNCTIONS = {__name__: ["retrieve_data", "save_data"]}
+# Looked up on each call, so instrumentation can swap them for wrappers
+session = DataSession(
+    lambda: retrieve_data(), lambda data: save_data(data), AUTOSAVE_DELAY
+)
 
 
 def main():
+    if os.environ.get("TODO_TIMING"):
+        instrumentation.enable(TIMED_FUNCTIONS)
+    data = session.data
+    session.start_autosave()
     while True:
         choice = input("Enter choice or '?' for controls: ")
         if choice == "?":
@@ -181,24 +386,35 @@ def main():
             new_item = prompt_for_new_item(data)
             if not new_item is None:
                 add_item(data, new_item)
+                session.notify()
                 print("Item added successfully.")
             else:
                 print("Item not added.")
         elif choice == "di":
-            display_items(data["items"])
+            display_items(data.items)
         elif choice == "e":
             enter_day_view(data)
         elif choice == "d":
             item_desc = prompt_for_existing_item_desc(data)
             if not item_desc is None:
                 delete_item(data, item_desc)
+                session.notify()
                 print("Item deleted successfully.")
             else:
                 print("Item not deleted.")
+        elif choice == "c":
+            record_completion(data)
+        elif choice == "im":
+            import_from_file(data)
+        elif choice == "ti":
+            toggle_timing()
+        elif choice == "st":
+            display_timing_stats()
         elif choice == "q":
             quit_program(data)
         elif choice == "ed":
             prompt_for_edit_item(data)
+            session.notify()
         else:
             print("Invalid choice")
 
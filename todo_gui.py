@@ -1,16 +1,80 @@
-from todo import save_data
-from models import UserData, Item
-import json
+from todo import save_data, session
+from models import Item
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
 from helpers import *
 from managers import *
 import tkinter as tk
 from tkinter import ttk, messagebox
 from tkcalendar import DateEntry
-from datetime import date
+from datetime import date, timedelta
+from analytics import period_start, planned_minutes
+
+
+START_TIME = time.perf_counter()
+# Startup times are only printed when timing is on, as in the CLI
+TIMING = bool(os.environ.get("TODO_TIMING"))
+
+
+# Runs loads, saves and queries off the Tk thread. Jobs run one at a time on
+# a single worker thread, in the order they were submitted, and each result is
+# handed to its callback on the Tk thread by polling a queue with after(),
+# since Tk may only be used from the thread running the mainloop.
+class BackgroundWorker:
+    POLL_MS = 20
+
+    def __init__(self, root, on_status):
+        self.root = root
+        self.on_status = on_status
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.done = queue.Queue()
+        # Status messages of the jobs not yet handed back, oldest first
+        self.pending = []
+
+    def submit(self, job, callback=None, status="Working..."):
+        future = self.executor.submit(job)
+        self.pending.append((future, status))
+        future.add_done_callback(lambda f: self.done.put((f, callback)))
+        if len(self.pending) == 1:
+            self.on_status(status)
+            self.root.after(self.POLL_MS, self.poll)
+
+    def poll(self):
+        while True:
+            try:
+                future, callback = self.done.get_nowait()
+            except queue.Empty:
+                break
+            self.pending = [p for p in self.pending if p[0] is not future]
+            if future.exception() is not None:
+                messagebox.showerror("Error", str(future.exception()))
+            elif callback is not None:
+                callback(future.result())
+
+        if self.pending:
+            self.on_status(self.pending[0][1])
+            self.root.after(self.POLL_MS, self.poll)
+        else:
+            self.on_status(None)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
 
+def locked_query(query):
+    # Queries hold the data lock against the autosaver. Mutations run on the
+    # worker as well (see mutate), so the Tk thread never waits on the lock
+    data = session.data
+    with data.lock:
+        return query(data)
 
-with open("data.json", "r") as file:
-    data = UserData(json.load(file))
+
+def mutate(mutation):
+    # Runs on the worker, after any queries already submitted
+    mutation(session.data)
+    session.notify()
 
 
 class MainScreen(tk.Frame):
@@ -49,7 +113,23 @@ class MainScreen(tk.Frame):
         self.edit_button = tk.Button(self.menu, text=f"Edit Item")
         self.edit_button.pack(pady=5)
 
-        # Create text on lhs
+        self.week_button = tk.Button(
+            self.menu, text=f"Week View", command=self.master.show_week_screen
+        )
+        self.week_button.pack(pady=5)
+
+        self.month_button = tk.Button(
+            self.menu, text=f"Month View", command=self.master.show_month_screen
+        )
+        self.month_button.pack(pady=5)
+
+        # Create text on lhs. Item labels are kept between refreshes, keyed
+        # by description, and only added or removed when the day's items change
+        self.today_label = tk.Label(self.day_view)
+        self.today_label.pack(pady=5, padx=10)
+        self.loading_label = tk.Label(self.day_view, text="Loading...")
+        self.item_labels = {}
+        self.shown = []
         self.refresh_day_view()
 
         # Create exit button
@@ -59,19 +139,105 @@ class MainScreen(tk.Frame):
         self.exit_button.pack(fill="both", expand=True)
 
     def refresh_day_view(self):
-        # Clear the day_view frame
-        for widget in self.day_view.winfo_children():
-            widget.destroy()
+        today = date.today()
+        if self.today_label["text"] != str(today):
+            self.today_label.configure(text=str(today))
 
-        # Re-create the today label
-        self.today_label = tk.Label(self.day_view, text=str(date.today()))
-        self.today_label.pack(pady=5, padx=10)
+        if not session.loaded:
+            self.loading_label.pack(pady=5, padx=10)
+            return
+        self.loading_label.pack_forget()
+
+        self.master.worker.submit(
+            lambda: locked_query(
+                lambda data: [i.description for i in get_items_for_date(data, today)]
+            ),
+            self.show_descriptions,
+        )
 
-        # Re-create the items for the current date
-        self.item_list = get_items_for_date(data, date.today())
-        for item in self.item_list:
-            item_label = tk.Label(self.day_view, text=item["description"])
-            item_label.pack(pady=5, padx=10)
+    def show_descriptions(self, descriptions):
+        if descriptions == self.shown:
+            return
+
+        for description in set(self.shown) - set(descriptions):
+            self.item_labels.pop(description).destroy()
+
+        # Labels that stay only need repacking if their order changed
+        kept = [d for d in self.shown if d in self.item_labels]
+        if kept != [d for d in descriptions if d in self.item_labels]:
+            for description in kept:
+                self.item_labels[description].pack_forget()
+            kept = []
+        kept = set(kept)
+
+        previous = self.today_label
+        for description in descriptions:
+            if description not in self.item_labels:
+                self.item_labels[description] = tk.Label(
+                    self.day_view, text=description
+                )
+            label = self.item_labels[description]
+            if description not in kept:
+                label.pack(pady=5, padx=10, after=previous)
+            previous = label
+
+        self.shown = descriptions
+
+
+# A scrollable list of items on a ttk.Treeview, which only draws the rows in
+# view. Rows are keyed by description and kept between refreshes, so a
+# refresh only touches the rows that were added, removed or changed.
+class ItemList(ttk.Frame):
+    COLUMNS = ("type", "frequency", "active")
+
+    def __init__(self, master=None, selectmode="none", **kwargs):
+        super().__init__(master, **kwargs)
+
+        self.tree = ttk.Treeview(
+            self, columns=self.COLUMNS, selectmode=selectmode, height=20
+        )
+        self.tree.heading("#0", text="Description")
+        for column in self.COLUMNS:
+            self.tree.heading(column, text=column.capitalize())
+            self.tree.column(column, width=90, stretch=False)
+        self.scrollbar = ttk.Scrollbar(
+            self, orient="vertical", command=self.tree.yview
+        )
+        self.tree.configure(yscrollcommand=self.scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill="both", expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill="y")
+
+        self.rows = {}
+
+    @staticmethod
+    def rows_for(data):
+        return {
+            item.description: (
+                item.type,
+                item.frequency if item.type == "routine" else "",
+                "yes" if item.active else "no",
+            )
+            for item in data.items
+        }
+
+    def show(self, rows):
+        removed = [iid for iid in self.rows if iid not in rows]
+        if removed:
+            self.tree.delete(*removed)
+
+        # Items keep their relative order, so inserting each new row at its
+        # position as we go leaves every row where it belongs
+        for i, (iid, values) in enumerate(rows.items()):
+            if iid not in self.rows:
+                self.tree.insert("", i, iid=iid, text=iid, values=values)
+            elif self.rows[iid] != values:
+                self.tree.item(iid, values=values)
+
+        self.rows = rows
+
+    def selected(self):
+        selection = self.tree.selection()
+        return selection[0] if selection else None
 
 
 class ItemsScreen(tk.Frame):
@@ -81,37 +247,33 @@ class ItemsScreen(tk.Frame):
         self.label = tk.Label(self, text="All items")
         self.label.pack()
 
+        self.item_list = ItemList(self)
+        self.item_list.pack(fill="both", expand=True, padx=10, pady=5)
+
         self.menu_button = tk.Button(
             self, text="Go to Main Screen", command=self.master.show_main_screen
         )
         self.menu_button.pack()
 
-        # Call refresh_items() after defining self.menu_button
         self.refresh_items()
 
     def refresh_items(self):
-        # Clear the items frame
-        for widget in self.winfo_children():
-            if isinstance(widget, tk.Label) and widget["text"] != "All items":
-                widget.destroy()
-
-        # Re-create the items
-        for item in data.items:
-            self.item_label = tk.Label(self, text=item.description)
-            self.item_label.pack(padx=10, pady=5)
+        if not session.loaded:
+            return
 
-        # Delete and repack the button so it's at the bottom
-        self.menu_button.pack_forget()
-        self.menu_button.pack()
+        self.master.worker.submit(
+            lambda: locked_query(ItemList.rows_for), self.item_list.show
+        )
 
 
 class DeleteScreen(tk.Frame):
     def __init__(self, master=None, **kwargs):
         super().__init__(master, **kwargs)
 
-        self.v = tk.StringVar(value=0)
         self.label = tk.Label(self, text="Select item to delete.")
         self.label.pack()
+        self.item_list = ItemList(self, selectmode="browse")
+        self.item_list.pack(fill="both", expand=True, padx=10, pady=5)
         self.select_button = tk.Button(self, text="Select", command=self.submit_action)
         self.select_button.pack()
         self.cancel_button = tk.Button(
@@ -122,33 +284,176 @@ class DeleteScreen(tk.Frame):
         self.refresh_items()
 
     def refresh_items(self):
-        # Clear current Radiobuttons
-        for widget in self.winfo_children():
-            if isinstance(widget, tk.Radiobutton):
-                widget.destroy()
-
-        # Create Radiobuttons for items in the data
-        for item in data.items:
-            item_button = tk.Radiobutton(
-                self,
-                text=item.description,
-                variable=self.v,
-                value=item.description,
-            )
-            item_button.pack(padx=10, pady=5)
+        if not session.loaded:
+            return
 
-        # Delete and repack the submit and cancel buttons so at bottom
-        self.select_button.pack_forget()
-        self.cancel_button.pack_forget()
-        self.select_button.pack()
-        self.cancel_button.pack()
+        self.master.worker.submit(
+            lambda: locked_query(ItemList.rows_for), self.item_list.show
+        )
 
     def submit_action(self):
-        # Delete item from data
-        delete_item(data, self.v.get())
+        item_desc = self.item_list.selected()
+        if item_desc is None:
+            messagebox.showerror("Error", "No item selected.")
+            return
+
+        # Delete item from data. The main screen's refresh is queued behind it
+        self.master.worker.submit(
+            lambda: mutate(lambda data: delete_item(data, item_desc)),
+            status="Deleting...",
+        )
         self.master.show_main_screen()
 
 
+def calendar_days(data, start, end):
+    """
+    Parameters:
+        data (UserData): The data to get items from.
+        start (datetime.date): The first date of the range.
+        end (datetime.date): The last date of the range (inclusive).
+
+    Returns:
+        dict: A mapping of every date in the range to the descriptions of its
+        items and the minutes planned for them.
+    """
+
+    items = get_items_for_range(data, start, end)
+    minutes = planned_minutes(data, start, end, "day", active_only=False)
+    return {
+        day: ([item.description for item in items.get(day, [])], total)
+        for day, total in minutes.items()
+    }
+
+
+# A week or a month of days, each listing its items and planned minutes. A
+# period is filled by one range query on the worker, and the periods either
+# side are fetched in the background as well, so paging is instant. Fetched
+# periods are dropped each time the screen is opened, since items can only
+# change while it is closed.
+class CalendarScreen(tk.Frame):
+    MAX_LINES = 4
+
+    def __init__(self, master=None, period="week", **kwargs):
+        super().__init__(master, **kwargs)
+
+        self.period = period
+        self.start = period_start(period, date.today())
+        self.fetched = {}
+        self.requested = set()
+        # Bumped on each refresh so results fetched before it are ignored
+        self.generation = 0
+
+        self.header = tk.Frame(self)
+        self.header.pack(fill=tk.X)
+        self.prev_button = tk.Button(self.header, text="<", command=self.show_previous)
+        self.prev_button.pack(side=tk.LEFT, padx=5)
+        self.label = tk.Label(self.header)
+        self.label.pack(side=tk.LEFT, expand=True)
+        self.next_button = tk.Button(self.header, text=">", command=self.show_next)
+        self.next_button.pack(side=tk.RIGHT, padx=5)
+
+        self.grid_frame = tk.Frame(self)
+        self.grid_frame.pack(fill="both", expand=True)
+        weekdays = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+        for column, weekday in enumerate(weekdays):
+            tk.Label(self.grid_frame, text=weekday).grid(row=0, column=column)
+
+        # Enough cells for the longest month, reused for every period
+        rows = 1 if period == "week" else 6
+        self.cells = []
+        for i in range(7 * rows):
+            cell = tk.Label(
+                self.grid_frame,
+                width=14,
+                height=self.MAX_LINES + 2,
+                anchor="nw",
+                justify=tk.LEFT,
+                relief=tk.GROOVE,
+                bg="#d8f0e3",
+            )
+            cell.grid(row=i // 7 + 1, column=i % 7, sticky="nsew")
+            self.cells.append(cell)
+
+        self.menu_button = tk.Button(
+            self, text="Go to Main Screen", command=self.master.show_main_screen
+        )
+        self.menu_button.pack()
+
+    def period_end(self, start):
+        if self.period == "week":
+            return start + timedelta(days=6)
+        return period_start("month", start + timedelta(days=31)) - timedelta(days=1)
+
+    def neighbours(self):
+        return period_start(self.period, self.start - timedelta(days=1)), (
+            self.period_end(self.start) + timedelta(days=1)
+        )
+
+    def refresh_calendar(self):
+        self.generation += 1
+        self.fetched.clear()
+        self.requested.clear()
+        self.show_period()
+
+    def show_previous(self):
+        self.start = self.neighbours()[0]
+        self.show_period()
+
+    def show_next(self):
+        self.start = self.neighbours()[1]
+        self.show_period()
+
+    def show_period(self):
+        end = self.period_end(self.start)
+        self.label.configure(text=f"{self.start} to {end}")
+        if self.start in self.fetched:
+            self.fill_cells()
+        else:
+            for cell in self.cells:
+                cell.configure(text="")
+
+        if not session.loaded:
+            return
+        self.fetch(self.start)
+        for start in self.neighbours():
+            self.fetch(start)
+
+    def fetch(self, start):
+        if start in self.requested:
+            return
+        self.requested.add(start)
+        end = self.period_end(start)
+        generation = self.generation
+
+        def on_fetched(days):
+            if generation != self.generation:
+                return
+            self.fetched[start] = days
+            if start == self.start:
+                self.fill_cells()
+
+        self.master.worker.submit(
+            lambda: locked_query(lambda data: calendar_days(data, start, end)),
+            on_fetched,
+            "Loading calendar...",
+        )
+
+    def fill_cells(self):
+        days = self.fetched[self.start]
+        offset = self.start.weekday()
+        for i, cell in enumerate(self.cells):
+            day = self.start + timedelta(days=i - offset)
+            if day not in days:
+                cell.configure(text="")
+                continue
+
+            descriptions, minutes = days[day]
+            lines = [f"{day.day}  ({minutes} min)"] + descriptions[: self.MAX_LINES]
+            if len(descriptions) > self.MAX_LINES:
+                lines[-1] = f"+{len(descriptions) - self.MAX_LINES + 1} more"
+            cell.configure(text="\n".join(lines))
+
+
 class AddScreen(tk.Frame):
     def __init__(self, master=None, **kwargs):
         super().__init__(master, **kwargs)
@@ -341,7 +646,14 @@ class AddScreen(tk.Frame):
         elif type_selected == "routine":
             item["rschedule"] = rschedule
             item["frequency"] = freq_selected
-        add_item(data, item)
+        try:
+            item = Item.from_dict(item)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid item: {e}")
+            return
+        self.master.worker.submit(
+            lambda: mutate(lambda data: add_item(data, item)), status="Adding..."
+        )
 
         # Return to main screen
         self.master.show_main_screen()
@@ -507,12 +819,52 @@ class RoutineScheduleRow(ttk.Frame):
 class MainApplication(tk.Tk):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+
+        # Progress indicator shown while the worker is busy
+        self.status_bar = ttk.Frame(self)
+        self.status_label = ttk.Label(self.status_bar)
+        self.status_label.pack(side=tk.LEFT, padx=5)
+        self.progress = ttk.Progressbar(self.status_bar, mode="indeterminate")
+        self.progress.pack(side=tk.RIGHT, padx=5)
+        self.worker = BackgroundWorker(self, self.show_status)
+
         self.main_screen = MainScreen(self)
         self.items_screen = ItemsScreen(self)
         self.delete_screen = DeleteScreen(self)
         self.add_screen = AddScreen(self)
+        self.week_screen = CalendarScreen(self, "week")
+        self.month_screen = CalendarScreen(self, "month")
         self.current_screen = None
         self.show_main_screen()
+        self.after_idle(self.on_first_paint)
+        self.worker.submit(session.ensure_loaded, self.on_data_loaded, "Loading...")
+
+    def on_first_paint(self):
+        if TIMING:
+            print(f"Window shown after {time.perf_counter() - START_TIME:.3f}s")
+
+    def show_status(self, status):
+        if status is None:
+            self.progress.stop()
+            self.status_bar.pack_forget()
+        else:
+            self.status_label.configure(text=status)
+            if not self.status_bar.winfo_manager():
+                self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+                self.progress.start(10)
+
+    def on_data_loaded(self, _):
+        if session.error is not None:
+            messagebox.showerror("Error", f"Could not load data: {session.error}")
+            # Destroy once the worker is done updating the status bar
+            self.after_idle(self.destroy)
+            return
+
+        if TIMING:
+            print(f"Data loaded in {session.load_seconds:.3f}s")
+        session.start_autosave()
+        if self.current_screen is self.main_screen:
+            self.show_main_screen()
 
     def show_main_screen(self):
         self.main_screen.refresh_day_view()
@@ -526,6 +878,14 @@ class MainApplication(tk.Tk):
         self.delete_screen.refresh_items()
         self._show_screen(self.delete_screen)
 
+    def show_week_screen(self):
+        self.week_screen.refresh_calendar()
+        self._show_screen(self.week_screen)
+
+    def show_month_screen(self):
+        self.month_screen.refresh_calendar()
+        self._show_screen(self.month_screen)
+
     def show_add_screen(self):
         self._show_screen(self.add_screen)
 
@@ -537,8 +897,18 @@ class MainApplication(tk.Tk):
 
     def on_closing(self):
         if messagebox.askokcancel("Quit", "Do you want to save data and quit?"):
-            save_data(data)
-            self.destroy()
+            if session.loaded and session.error is None:
+                self.worker.submit(self.save_and_stop, self.on_saved, "Saving...")
+            else:
+                self.on_saved(None)
+
+    def save_and_stop(self):
+        session.stop_autosave()
+        save_data(session.data)
+
+    def on_saved(self, _):
+        self.worker.shutdown()
+        self.after_idle(self.destroy)
 
 
 if __name__ == "__main__":
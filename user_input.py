@@ -2,6 +2,7 @@ from datetime import date, timedelta
 from validation import *
 from helpers import *
 from managers import *
+from models import Item
 
 
 CANCEL = "cancel"
@@ -37,14 +38,14 @@ def prompt_for_new_item(data):
     Gets a new item from the user with valid input.
 
     Parameters:
-        data (dict): The data to validate against.
+        data (UserData): The data to validate against.
 
     Returns:
-        dict: A valid item dictionary or
+        Item: A valid item or
         None.
     """
 
-    if not is_valid_data(data):
+    if not is_valid_user_data(data):
         raise ValueError("Data is not valid")
 
     while True:
@@ -77,7 +78,7 @@ def prompt_for_new_item(data):
             item["rschedule"] = rschedule
 
         if is_valid_item(item):
-            return item
+            return Item.from_dict(item)
         else:
             print("Incompatible item attributes.")
 
@@ -85,7 +86,7 @@ def prompt_for_new_item(data):
 def prompt_for_new_item_desc(data):
     """
     Parameters:
-        data (dict): The data with which to compare item desc.
+        data (UserData): The data with which to compare item desc.
 
     Returns:
         str: A description for a new item or
@@ -95,7 +96,7 @@ def prompt_for_new_item_desc(data):
         ValueError: If the data is invalid.
     """
 
-    if not is_valid_data(data):
+    if not is_valid_user_data(data):
         raise ValueError("Invalid data.")
 
     return prompt_for_value(
@@ -108,7 +109,7 @@ def prompt_for_new_item_desc(data):
 def prompt_for_existing_item_desc(data):
     """
     Parameters:
-        data (dict): The data to get an item from.
+        data (UserData): The data to get an item from.
 
     Returns:
         str: A description for an existing item or
@@ -118,7 +119,7 @@ def prompt_for_existing_item_desc(data):
         ValueError: If the data is invalid.
     """
 
-    if not is_valid_data(data):
+    if not is_valid_user_data(data):
         raise ValueError("Invalid data.")
 
     return prompt_for_value(
@@ -239,7 +240,7 @@ def prompt_for_compatible_item_attribute_value(attribute, **kwargs):
 def prompt_for_existing_item_attribute(item):
     """
     Parameters:
-        item (dict): The item test the attribute against
+        item (Item): The item test the attribute against
 
     Returns:
         str: The attribute or
@@ -249,13 +250,13 @@ def prompt_for_existing_item_attribute(item):
         ValueError: if item is not valid
     """
 
-    if not is_valid_item(item):
+    if not isinstance(item, Item):
         raise ValueError("item is not valid")
 
     return prompt_for_value(
-        f"Enter existing attribute for {item['description']}: ",
-        lambda i: is_valid_attribute_key(i) and i in item,
-        f"Invalid or non-existent attribute for {item['description']}",
+        f"Enter existing attribute for {item.description}: ",
+        lambda i: is_valid_attribute_key(i) and hasattr(item, i),
+        f"Invalid or non-existent attribute for {item.description}",
     )
 
 
@@ -1,5 +1,6 @@
 import json
 from datetime import date
+from models import UserData
 
 
 VALID_ITEM_ATTRIBUTES = [
@@ -79,6 +80,22 @@ def is_valid_data(data):
     return True
 
 
+def is_valid_user_data(data):
+    """
+    Parameters:
+        data (UserData): data to validate
+
+    Returns:
+        bool: True if data is valid, False otherwise
+
+    Note:
+        Data is fully validated when loaded, so this only re-validates the
+        items that have been mutated since the last check.
+    """
+
+    return isinstance(data, UserData) and data.is_valid()
+
+
 # Validation functions for data dictionary
 
 
@@ -206,7 +223,10 @@ def goal_attribute_values_compatible(gschedule, start_date, deadline):
     if not is_valid_date(deadline):
         raise ValueError("Invalid deadline")
 
-    return all([start_date <= spec[0] <= deadline for spec in gschedule])
+    if not gschedule:
+        return True
+    dates = [spec[0] for spec in gschedule]
+    return start_date <= min(dates) and max(dates) <= deadline
 
 
 def item_attribute_values_compatible(**kwargs):
@@ -240,6 +260,43 @@ def item_attribute_values_compatible(**kwargs):
         )
 
 
+def attribute_value_compatible(item, attribute, value):
+    """
+    Checks a new attribute value against the rest of an existing item, touching
+    only the invariants that involve that attribute.
+
+    Parameters:
+        item (Item): item the value is for
+        attribute (str): attribute to be changed
+        value (any): new value for the attribute, already valid in isolation
+
+    Returns:
+        bool: True if value is compatible with the item, False otherwise
+    """
+
+    if attribute in {"description", "active"}:
+        return True
+
+    if item.type == "goal":
+        if attribute == "start_date":
+            bounds = item.gschedule_bounds
+            return bounds is None or value <= bounds[0]
+        elif attribute == "deadline":
+            bounds = item.gschedule_bounds
+            return bounds is None or bounds[1] <= value
+        elif attribute == "gschedule":
+            return goal_attribute_values_compatible(
+                value, item.start_date, item.deadline
+            )
+    elif item.type == "routine":
+        if attribute == "rschedule":
+            return routine_attribute_values_compatible(value, item.frequency)
+        elif attribute == "frequency":
+            return routine_attribute_values_compatible(item.rschedule, value)
+
+    return False
+
+
 # Validation functions for item keys
 
 
@@ -421,7 +478,7 @@ def is_valid_attribute_value(attribute, value):
     elif attribute == "active":
         return is_valid_active(value)
     elif attribute == "rschedule":
-        return is_valid_rschedule(json.loads(value))
+        return is_valid_rschedule(value)
     elif attribute == "frequency":
         return is_valid_frequency(value)
     elif attribute == "gschedule":